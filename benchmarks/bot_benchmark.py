@@ -0,0 +1,215 @@
+# bot_benchmark.py
+'''Times the bot's data paths against local stand-ins and writes machine-readable results.
+
+Run from the repository root:
+    python -m benchmarks.bot_benchmark [--output new.json] [--compare old.json]'''
+# Disable:
+#   C0301: line length (unavoidable)
+#   C0415: import outside toplevel (discord_bot reads its configuration at import time)
+#   R0914: too many local variables (one benchmark run wires everything together)
+# pylint: disable=C0301,C0415,R0914
+
+import argparse
+import asyncio
+import datetime
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import CITIES, DiscordRESTStub, FakeDynamoDB, StatusPageServer, seed_fake_dynamodb
+
+def prepare_environment(work_dir: str) -> None:
+    '''Points discord_bot's configuration at throwaway local settings so importing it touches no real service'''
+    aws_config_path = os.path.join(work_dir, 'aws_config')
+    with open(aws_config_path, 'w', encoding='utf-8') as f:
+        f.write('[profile benchmark]\nregion = us-east-1\n')
+    os.environ.pop('LOGNAME', None) # DEV_MODE, so no /opt/invasion-bot config files are read
+    os.environ.update({
+        'AWS_CONFIG_FILE': aws_config_path,
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'DEV_AWS_PROFILE': 'benchmark',
+        'DISCORD_TOKEN': 'benchmark',
+        'LOG_FILE_NAME': os.path.join(work_dir, 'benchmark.log'),
+        'LOG_LEVEL': 'WARNING',
+        'SNAPSHOT_FILE_NAME': os.path.join(work_dir, 'snapshot.json'),
+        'METRICS_PORT': '',
+        'ADMIN_USER_IDS': ''
+    })
+
+def summarize(samples: list) -> dict:
+    '''Returns run count and min/median/p95/max in milliseconds for [samples] in seconds'''
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+async def measure(coroutine_function, runs: int, setup=None) -> list:
+    '''Awaits coroutine_function() [runs] times, running the optional setup() before each, returns durations'''
+    samples = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        await coroutine_function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def run_benchmarks(bot_module, args) -> dict:
+    '''Wires discord_bot to the local stand-ins and times each path'''
+    from utils.dynamodb_loader import DynamoDBLoader
+    from utils.event_source import SingleTableEventSource
+    from utils.siege_schedule import server_today
+    from utils.sync_markers import SIEGE_WINDOW_SOURCE, SyncMarkers
+    from world_status import NWWorldStatusPoller, build_world_index, parse_server_status
+
+    results = {}
+    db = FakeDynamoDB(latency=args.db_latency_ms / 1000)
+    seed_fake_dynamodb(db, bot_module.config['EVENT_TABLE_PREFIX'], bot_module.config['SIEGE_INFO_TABLE_NAME'], server_today(), days=bot_module.EVENT_HORIZON_DAYS)
+    bot_module.DB_LOADER = DynamoDBLoader(db, logger=bot_module.logger)
+
+    async def measure_db_reads(coroutine_function) -> dict:
+        db.calls.clear()
+        samples = await measure(coroutine_function, args.runs)
+        return dict(summarize(samples), db_calls_per_run={op: count / args.runs for op, count in db.calls.items()})
+    results['refresh_siege_window'] = await measure_db_reads(bot_module.refresh_siege_window)
+    results['refresh_event_data'] = await measure_db_reads(bot_module.refresh_event_data)
+    seed_fake_dynamodb(db, bot_module.config['EVENT_TABLE_PREFIX'], bot_module.config['SIEGE_INFO_TABLE_NAME'], server_today(), days=bot_module.EVENT_HORIZON_DAYS, event_table_name='benchmark-events')
+    bot_module.EVENT_SOURCE = SingleTableEventSource(bot_module.DB_LOADER, 'benchmark-events', CITIES, logger=bot_module.logger)
+    results['refresh_event_data_single_table'] = await measure_db_reads(bot_module.refresh_event_data)
+    bot_module.SYNC_MARKERS = SyncMarkers(bot_module.DB_LOADER, 'benchmark-sync-markers', [*CITIES, SIEGE_WINDOW_SOURCE])
+    await bot_module.refresh_siege_window()
+    await bot_module.refresh_event_data()
+    results['refresh_changed_data_unchanged'] = await measure_db_reads(bot_module.refresh_changed_data)
+
+    keys = [('windows',)] + [('events', city, day) for city in [None, *CITIES] for day in [None] + bot_module.EVENT_DAY_OPTIONS]
+    async def answer_every_command():
+        for key in keys:
+            await bot_module.response_cache.get(key)
+    results['render_command_responses'] = summarize(await measure(bot_module.response_cache.rebuild, args.runs))
+    results['command_lookup_all_keys'] = dict(summarize(await measure(answer_every_command, args.runs)), keys=len(keys))
+
+    status_server = StatusPageServer(latency=args.status_latency_ms / 1000)
+    status_url = await status_server.start()
+    all_worlds = list(build_world_index(parse_server_status(status_server.page_content)))
+    watched_worlds = all_worlds[::max(1, len(all_worlds) // args.worlds)][:args.worlds] # spread over every region
+    bot_module.world_status_poller = NWWorldStatusPoller(watched_worlds, nw_url=status_url)
+    bot_module.WORLDS_WITH_STATUS_UPDATE_ENABLED = {}
+    results['world_status_scrape'] = dict(summarize(await measure(bot_module.refresh_world_statuses, args.runs)), watched_worlds=len(watched_worlds))
+    await bot_module.world_status_poller.close()
+    await status_server.stop()
+
+    results.update(await run_guild_event_benchmarks(bot_module, args))
+    return results
+
+async def run_guild_event_benchmarks(bot_module, args) -> dict:
+    '''Times update_guild_events() against the Discord REST stub, from empty guilds and again once they match
+
+    The steady run follows the cold one within LISTED_GUILD_TTL, so its guilds are served from the cache. The
+    expired run lists every guild again, like a reconcile after the TTL.'''
+    from utils.discord_commands import DiscordCommands
+    from utils.guild_event_cache import GuildEventCache
+    from utils.guild_event_reconciler import GuildEventReconciler
+
+    discord_stub = DiscordRESTStub(bucket_size=args.bucket_size, bucket_reset=args.bucket_reset_ms / 1000)
+    client = DiscordCommands('benchmark', base_url=await discord_stub.start())
+    bot_module.event_client = client
+    bot_module.guild_event_reconciler = GuildEventReconciler(
+        client,
+        is_managed=bot_module.is_managed_guild_event,
+        max_concurrent_guilds=args.concurrent_guilds,
+        logger=bot_module.logger
+    )
+    bot_module.GUILDS_WITH_EVENT_CREATION_ENABLED = [str(10 ** 17 + guild) for guild in range(args.guilds)]
+    discord_stub.requests = discord_stub.rate_limited = 0
+    def start_cold():
+        discord_stub.guild_events.clear()
+        bot_module.guild_event_reconciler.cache = GuildEventCache()
+    samples = await measure(bot_module.update_guild_events, max(1, args.runs // 5), setup=start_cold)
+    results = {'update_guild_events_cold': dict(
+        summarize(samples),
+        guilds=args.guilds,
+        requests_per_run=discord_stub.requests / len(samples),
+        rate_limited_per_run=discord_stub.rate_limited / len(samples)
+    )}
+    discord_stub.requests = discord_stub.rate_limited = 0
+    samples = await measure(bot_module.update_guild_events, max(1, args.runs // 5))
+    results['update_guild_events_steady'] = dict(summarize(samples), guilds=args.guilds, requests_per_run=discord_stub.requests / len(samples))
+    discord_stub.requests = 0
+    samples = await measure(bot_module.update_guild_events, max(1, args.runs // 5), setup=lambda: setattr(bot_module.guild_event_reconciler, 'cache', GuildEventCache(listed_ttl=0)))
+    results['update_guild_events_expired'] = dict(summarize(samples), guilds=args.guilds, requests_per_run=discord_stub.requests / len(samples))
+    await client.close()
+    await discord_stub.stop()
+    return results
+
+def git_commit() -> str:
+    '''Returns the current commit hash, or None outside a git checkout'''
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, check=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_comparison(old_report: dict, new_report: dict) -> None:
+    '''Prints the median of each benchmark in both reports and the relative change'''
+    print(f"{'benchmark':<28} {'old ms':>10} {'new ms':>10} {'change':>8}")
+    for name, new_result in new_report['results'].items():
+        old_result = old_report['results'].get(name)
+        if old_result is None:
+            print(f"{name:<28} {'-':>10} {new_result['median_ms']:>10.2f} {'new':>8}")
+            continue
+        change = (new_result['median_ms'] - old_result['median_ms']) / old_result['median_ms'] * 100 if old_result['median_ms'] else 0
+        print(f"{name:<28} {old_result['median_ms']:>10.2f} {new_result['median_ms']:>10.2f} {change:>+7.1f}%")
+
+def main() -> None:
+    '''Runs every benchmark and writes the JSON report'''
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n', maxsplit=1)[0])
+    arg_parser.add_argument('--runs', type=int, default=20, help='timed runs per benchmark')
+    arg_parser.add_argument('--guilds', type=int, default=25, help='guilds with event creation enabled')
+    arg_parser.add_argument('--concurrent-guilds', type=int, default=5, help='guilds reconciled at once')
+    arg_parser.add_argument('--worlds', type=int, default=10, help='watched worlds')
+    arg_parser.add_argument('--db-latency-ms', type=float, default=10, help='simulated DynamoDB round trip')
+    arg_parser.add_argument('--status-latency-ms', type=float, default=50, help='simulated status page response time')
+    arg_parser.add_argument('--bucket-size', type=int, default=5, help='Discord stub requests per rate limit bucket')
+    arg_parser.add_argument('--bucket-reset-ms', type=float, default=250, help='Discord stub bucket reset interval')
+    arg_parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    arg_parser.add_argument('--compare', help='a previous JSON report to compare medians against')
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        prepare_environment(work_dir)
+        bot_module = importlib.import_module('discord_bot')
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(run_benchmarks(bot_module, args))
+        finally:
+            loop.close()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'parameters': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
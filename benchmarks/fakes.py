@@ -0,0 +1,222 @@
+# fakes.py
+'''Local stand-ins for DynamoDB, the Discord REST API and the NW status page'''
+# Disable:
+#   C0301: line length (unavoidable)
+#   R0902: too many instance attributes (stubs keep their counters on the instance)
+#   R0913: too many arguments (seed parameters)
+#   R0914: too many local variables (query takes every boto3 Query parameter)
+# pylint: disable=C0301,R0902,R0913,R0914
+
+import asyncio
+import datetime
+import itertools
+import os
+import random
+import re
+import threading
+import time
+
+from aiohttp import web
+
+from utils.event_source import CITIES, city_table_name
+
+SIEGE_TIMES = ['07:00 PM', '07:30 PM', '08:00 PM', '08:30 PM', '09:00 PM', '09:30 PM', '10:00 PM', '10:30 PM', '11:00 PM']
+
+class FakeDynamoDB:
+    '''In-memory dynamodb client with the same call signatures as boto3, sleeping [latency] seconds per call'''
+    def __init__(self, latency: float = 0.01) -> None:
+        self.latency = latency
+        self.tables = {}
+        self.calls = {}
+        self.__lock = threading.Lock()
+
+    def __record(self, operation: str) -> None:
+        with self.__lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        time.sleep(self.latency) # stands in for the network round trip
+
+    def put_item(self, TableName: str, Item: dict, key_names: tuple) -> None: # pylint: disable=C0103
+        '''Stores [Item] under the values of [key_names] (not part of the boto3 API, used for seeding)'''
+        key = tuple(Item[name]['S'] for name in key_names)
+        self.tables.setdefault(TableName, {})[key] = Item
+
+    def __lookup(self, table_name: str, key: dict) -> dict:
+        return self.tables.get(table_name, {}).get(tuple(value['S'] for value in key.values()))
+
+    def get_item(self, TableName: str, Key: dict) -> dict: # pylint: disable=C0103
+        '''boto3 GetItem'''
+        self.__record('get_item')
+        item = self.__lookup(TableName, Key)
+        return {'Item': item} if item is not None else {}
+
+    def batch_get_item(self, RequestItems: dict) -> dict: # pylint: disable=C0103
+        '''boto3 BatchGetItem, enforcing the 100 key limit'''
+        self.__record('batch_get_item')
+        if sum(len(request['Keys']) for request in RequestItems.values()) > 100:
+            raise ValueError('BatchGetItem accepts at most 100 keys')
+        responses = {}
+        for table_name, request in RequestItems.items():
+            responses[table_name] = [
+                item for item in (self.__lookup(table_name, key) for key in request['Keys']) if item is not None
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def query(self, TableName: str, KeyConditionExpression: str, ExpressionAttributeNames: dict, ExpressionAttributeValues: dict, IndexName: str = None, ExclusiveStartKey: dict = None) -> dict: # pylint: disable=C0103,W0613
+        '''boto3 Query for "#a = :a" with an optional "AND #b BETWEEN :s AND :e", on a table or any index'''
+        self.__record('query')
+        match = re.fullmatch(r'(#\w+) = (:\w+)(?: AND (#\w+) BETWEEN (:\w+) AND (:\w+))?', KeyConditionExpression)
+        if match is None:
+            raise ValueError(f'Unsupported key condition {KeyConditionExpression!r}')
+        partition_name, partition_value, sort_name, sort_start, sort_end = match.groups()
+        items = []
+        for item in self.tables.get(TableName, {}).values():
+            if item.get(ExpressionAttributeNames[partition_name]) != ExpressionAttributeValues[partition_value]:
+                continue
+            if sort_name is not None:
+                sort_value = item.get(ExpressionAttributeNames[sort_name], {}).get('S')
+                if sort_value is None or not ExpressionAttributeValues[sort_start]['S'] <= sort_value <= ExpressionAttributeValues[sort_end]['S']:
+                    continue
+            items.append(item)
+        return {'Items': items, 'Count': len(items)}
+
+    def get_paginator(self, operation: str):
+        '''boto3 paginator, only scan is supported and every table fits in one page'''
+        if operation != 'scan':
+            raise ValueError(f'Unsupported paginator {operation}')
+        return self
+
+    def paginate(self, TableName: str, **_kwargs) -> list: # pylint: disable=C0103
+        '''boto3 Scan pages for [TableName]'''
+        self.__record('scan')
+        return [{'Items': list(self.tables.get(TableName, {}).values())}]
+
+    def batch_write_item(self, RequestItems: dict) -> dict: # pylint: disable=C0103
+        '''boto3 BatchWriteItem of put requests, enforcing the 25 item limit, keyed by date and city'''
+        self.__record('batch_write_item')
+        if sum(len(requests) for requests in RequestItems.values()) > 25:
+            raise ValueError('BatchWriteItem accepts at most 25 items')
+        for table_name, requests in RequestItems.items():
+            for request in requests:
+                self.put_item(table_name, request['PutRequest']['Item'], ('date', 'city'))
+        return {'UnprocessedItems': {}}
+
+def seed_fake_dynamodb(db: FakeDynamoDB, event_table_prefix: str, siege_table_name: str, start_date: datetime.date, days: int = 2, seed: int = 1, event_table_name: str = None) -> None:
+    '''Fills [db] with a siege window for every city and events on roughly half the city-days from [start_date]
+
+    Events go into one table per city, or into [event_table_name] keyed by date and city when it is given.'''
+    rnd = random.Random(seed)
+    for city in CITIES:
+        db.put_item(siege_table_name, {'city': {'S': city}, 'time': {'S': rnd.choice(SIEGE_TIMES)}}, ('city',))
+        for offset in range(days):
+            if rnd.random() < 0.5:
+                continue
+            date = (start_date + datetime.timedelta(days=offset)).strftime('%Y-%m-%d')
+            event_type = rnd.choice(['invasion', 'war'])
+            item = {
+                'date': {'S': date},
+                'type': {'S': event_type},
+                'attacker': {'S': 'Marauders' if event_type == 'war' else 'Corrupted'},
+                'defender': {'S': 'Syndicate'}
+            }
+            if event_table_name is None:
+                db.put_item(city_table_name(event_table_prefix, city), item, ('date',))
+            else:
+                db.put_item(event_table_name, dict(item, city={'S': city}), ('date', 'city'))
+
+class DiscordRESTStub:
+    '''Local Discord REST API for guild scheduled events with per-guild rate limit buckets'''
+    def __init__(self, bucket_size: int = 5, bucket_reset: float = 0.25, latency: float = 0.005) -> None:
+        self.bucket_size = bucket_size
+        self.bucket_reset = bucket_reset
+        self.latency = latency
+        self.guild_events = {} # guild_id -> {event_id: event}
+        self.requests = 0
+        self.rate_limited = 0
+        self.__buckets = {} # guild_id -> [remaining, reset_at]
+        self.__ids = itertools.count(1)
+        self.__runner = None
+
+    def __take(self, guild_id: str) -> dict:
+        '''Returns rate limit headers for the request, or None if the bucket is exhausted'''
+        now = time.monotonic()
+        bucket = self.__buckets.setdefault(guild_id, [self.bucket_size, now + self.bucket_reset])
+        if now >= bucket[1]:
+            bucket[0], bucket[1] = self.bucket_size, now + self.bucket_reset
+        if bucket[0] == 0:
+            return None
+        bucket[0] -= 1
+        return {
+            'X-RateLimit-Limit': str(self.bucket_size),
+            'X-RateLimit-Remaining': str(bucket[0]),
+            'X-RateLimit-Reset-After': f'{bucket[1] - now:.3f}',
+            'X-RateLimit-Bucket': 'scheduled-events'
+        }
+
+    async def __handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        guild_id = request.match_info['guild_id']
+        headers = self.__take(guild_id)
+        if headers is None:
+            self.rate_limited += 1
+            retry_after = max(0.0, self.__buckets[guild_id][1] - time.monotonic())
+            return web.json_response({'message': 'You are being rate limited.', 'retry_after': retry_after, 'global': False}, status=429, headers={'Retry-After': f'{retry_after:.3f}'})
+        events = self.guild_events.setdefault(guild_id, {})
+        event_id = request.match_info.get('event_id')
+        if request.method == 'GET':
+            return web.json_response(list(events.values()), headers=headers)
+        if request.method == 'POST':
+            event = dict(await request.json(), id=str(next(self.__ids)), guild_id=guild_id, status=1)
+            events[event['id']] = event
+            return web.json_response(event, headers=headers)
+        if event_id not in events:
+            return web.json_response({'message': 'Unknown Guild Scheduled Event', 'code': 10070}, status=404, headers=headers)
+        if request.method == 'PATCH':
+            events[event_id].update(await request.json())
+            return web.json_response(events[event_id], headers=headers)
+        del events[event_id]
+        return web.Response(status=204, headers=headers)
+
+    async def start(self, port: int = 0) -> str:
+        '''Starts the stub and returns its API base URL'''
+        app = web.Application()
+        app.router.add_route('*', '/api/v8/guilds/{guild_id}/scheduled-events', self.__handle)
+        app.router.add_route('*', '/api/v8/guilds/{guild_id}/scheduled-events/{event_id}', self.__handle)
+        self.__runner = web.AppRunner(app)
+        await self.__runner.setup()
+        site = web.TCPSite(self.__runner, '127.0.0.1', port)
+        await site.start()
+        return f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/api/v8' # pylint: disable=W0212
+
+    async def stop(self) -> None:
+        '''Stops the stub'''
+        await self.__runner.cleanup()
+
+class StatusPageServer:
+    '''Local server that returns a recorded NW server status page'''
+    def __init__(self, fixture_path: str = None, latency: float = 0.02) -> None:
+        fixture_path = fixture_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'server_status_launch.html')
+        with open(fixture_path, 'rb') as f:
+            self.page_content = f.read()
+        self.latency = latency
+        self.requests = 0
+        self.__runner = None
+
+    async def __handle(self, _request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return web.Response(body=self.page_content, content_type='text/html')
+
+    async def start(self, port: int = 0) -> str:
+        '''Starts the server and returns the base URL to use in place of https://www.newworld.com'''
+        app = web.Application()
+        app.router.add_get('/en-us/support/server-status', self.__handle)
+        self.__runner = web.AppRunner(app)
+        await self.__runner.setup()
+        site = web.TCPSite(self.__runner, '127.0.0.1', port)
+        await site.start()
+        return f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}' # pylint: disable=W0212
+
+    async def stop(self) -> None:
+        '''Stops the server'''
+        await self.__runner.cleanup()
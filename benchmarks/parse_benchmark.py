@@ -0,0 +1,56 @@
+# parse_benchmark.py
+'''Compares the fast status-page parser against the BeautifulSoup parser on saved status pages.
+
+Run from the repository root: python -m benchmarks.parse_benchmark [--repeat N]'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import argparse
+import os
+import statistics
+import timeit
+
+from world_status import fast_parse_region_server_status, fast_parse_server_status, region_data_index_match, soup_parse_region_server_status, soup_parse_server_status
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def time_parser(parser, page_content: bytes, region_id: int, repeat: int) -> float:
+    '''Returns the median seconds per call of parser(page_content, region_id) over [repeat] runs, or parser(page_content) if [region_id] is None'''
+    timer = timeit.Timer(lambda: parser(page_content) if region_id is None else parser(page_content, region_id))
+    number, _ = timer.autorange()
+    return statistics.median(t / number for t in timer.repeat(repeat=repeat, number=number))
+
+def main() -> None:
+    '''Runs both parsers for every region of every saved status page and prints the speedup'''
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n', maxsplit=1)[0])
+    arg_parser.add_argument('--repeat', type=int, default=5, help='timing runs per parser (median is reported)')
+    args = arg_parser.parse_args()
+
+    print(f"{'fixture':<32} {'region':<14} {'worlds':>6} {'soup ms':>9} {'fast ms':>9} {'speedup':>8}")
+    for fixture_name in sorted(os.listdir(FIXTURE_DIR)):
+        if not fixture_name.startswith('server_status'):
+            continue
+        with open(os.path.join(FIXTURE_DIR, fixture_name), 'rb') as f:
+            page_content = f.read()
+        for region, region_id in region_data_index_match.items():
+            fast_result = fast_parse_region_server_status(page_content, region_id)
+            soup_result = soup_parse_region_server_status(page_content, region_id)
+            assert fast_result == soup_result, f'Parsers disagree on {fixture_name} {region}'
+            soup_seconds = time_parser(soup_parse_region_server_status, page_content, region_id, args.repeat)
+            fast_seconds = time_parser(fast_parse_region_server_status, page_content, region_id, args.repeat)
+            print(
+                f'{fixture_name:<32} {region:<14} {len(fast_result):>6} '
+                f'{soup_seconds * 1000:>9.2f} {fast_seconds * 1000:>9.2f} {soup_seconds / fast_seconds:>7.1f}x'
+            )
+        fast_result = fast_parse_server_status(page_content)
+        assert fast_result == soup_parse_server_status(page_content), f'Parsers disagree on {fixture_name} all regions'
+        soup_seconds = time_parser(soup_parse_server_status, page_content, None, args.repeat)
+        fast_seconds = time_parser(fast_parse_server_status, page_content, None, args.repeat)
+        print(
+            f"{fixture_name:<32} {'all':<14} {sum(len(status_list) for status_list in fast_result.values()):>6} "
+            f'{soup_seconds * 1000:>9.2f} {fast_seconds * 1000:>9.2f} {soup_seconds / fast_seconds:>7.1f}x'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -3,31 +3,56 @@
 # Disable:
 #   C0206: dict-items (poor suggestion, may revist)
 #   C0301: line length (unavoidable)
+#   C0302: too many lines in module (TODO)
 #   R0912: too many branches (TODO)
 #   R0915: too many statements (TODO)
+#   W0603: global statement (state is replaced wholesale on refresh)
 #   W0703: exception is too general (TODO)
-#   W1203: logging with f-string (this works fine, plan to continue using)
-# pylint: disable=C0206,C0301,R0912,R0915,W0703,W1203
+# pylint: disable=C0206,C0301,C0302,R0912,R0915,W0603,W0703
 
+import asyncio
 import datetime
-import json
 import logging
-import math
 import os
+import signal
 import sys
+import threading
 import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 
+import aiohttp
 import boto3
 import discord
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from botocore.exceptions import ClientError
 from discord_slash import SlashCommand
 from discord_slash.utils.manage_commands import create_choice, create_option
 from dotenv import dotenv_values
-from utils.discord_commands import DiscordCommands
-from world_status import NWWorldStatusClient
+from utils.bot_data import BotData
+from utils.config_files import ConfigFileWatcher, parse_channel_events, parse_guild_events, parse_world_updates
+from utils.discord_commands import DiscordCommands, build_guild_event
+from utils.event_source import CITIES, DEFAULT_CITY_INDEX_NAME, PerCityEventSource, SingleTableEventSource
+from utils.event_store import EventStore
+from utils.dynamodb_loader import DynamoDBLoader
+from utils.guild_event_cache import parse_event_time
+from utils.guild_event_reconciler import GuildEventReconciler
+from utils.log_pipeline import LOG_LEVELS, configure_logging, cycle_log_level, set_log_level
+from utils.loop_watchdog import LoopWatchdog, profile_loop_thread
+from utils.memory_report import TRACEMALLOC_FRAMES, write_memory_report
+from utils.metrics import REGISTRY, start_metrics_server
+from utils.poll_schedule import CLOSED, OPEN, AdaptivePollSchedule
+from utils.response_cache import COUNTDOWN_PLACEHOLDER, ResponseCache
+from utils.sharding import ShardPlan
+from utils.siege_schedule import SERVER_TIMEZONE_NAME, format_duration, server_today
+from utils.single_flight import SingleFlight
+from utils.snapshot import dump_snapshot, load_snapshot, write_snapshot
+from utils.status_history import UNAVAILABLE_STATUSES, WorldStatusHistory
+from utils.sync_markers import SIEGE_WINDOW_SOURCE, SyncMarkers
+from world_status import NWWorldStatusPoller, StatusPageFormatError
 
 # Need a better way to determine this
 if 'LOGNAME' not in os.environ: # logname is env var on ec2, not on local dev
@@ -43,26 +68,10 @@ else:
     GUILD_EVENTS_CONFIG_FILEPATH = f'{_FILE_PREFIX}guild_events.json'
     WORLD_UPDATES_CONFIG_FILEPATH = f'{_FILE_PREFIX}world_updates.json'
 
-CITY_INFO = {
-    'Brightwood': {},
-    'Cutlass Keys': {},
-    'Ebonscale Reach': {},
-    'Everfall': {},
-    'First Light': {},
-    "Monarch's Bluffs": {},
-    'Mourningdale': {},
-    'Reekwater': {},
-    'Restless Shore': {},
-    'Windsward': {},
-    "Weaver's Fen": {}
-}
-
 CHANNELS_WITH_ANNOUNCE_ENABLED = {}
 GUILDS_WITH_EVENT_CREATION_ENABLED = []
 WORLDS_WITH_STATUS_UPDATE_ENABLED = {}
-TODAYS_CITIES_WITH_EVENTS = []
-TOMORROWS_CITIES_WITH_EVENTS = []
-UPCOMING_EVENT_INFO = {}
+DATA = BotData.empty(server_today()) # siege windows and events, only ever replaced whole, see utils/bot_data.py
 
 # Load configuration
 try:
@@ -71,35 +80,25 @@ try:
         **dotenv_values(f'{_FILE_PREFIX}.env.secret'),
         **os.environ # override .env vars with os environment vars
     }
+    SHARD_PLAN = ShardPlan.from_config(config)
+    # the watcher keeps these files' modification times so reload_config_files() can pick up edits
+    config_watcher = ConfigFileWatcher(logger=logging.getLogger(config['LOGGER_NAME']))
     if EVENTS_CONFIG_FILEPATH is not None:
-        with open(EVENTS_CONFIG_FILEPATH, encoding='utf-8') as f:
-            events_config = json.load(f)
-        for channel_id in events_config:
-            assert len(channel_id) == 18
-            assert events_config[channel_id]['event_hour'] <= 24
-            assert events_config[channel_id]['event_hour'] > 0
-            assert events_config[channel_id]['event_minute'] < 60
-            assert events_config[channel_id]['event_minute'] >= 0
-            if events_config[channel_id]['event_type'] == 'announcement':
-                CHANNELS_WITH_ANNOUNCE_ENABLED[channel_id] = {}
-                CHANNELS_WITH_ANNOUNCE_ENABLED[channel_id]['city'] = events_config[channel_id]['announcement_city']
-                CHANNELS_WITH_ANNOUNCE_ENABLED[channel_id]['hour'] = int(events_config[channel_id]['event_hour'])
-                CHANNELS_WITH_ANNOUNCE_ENABLED[channel_id]['minute'] = int(events_config[channel_id]['event_minute'])
+        CHANNELS_WITH_ANNOUNCE_ENABLED.update(config_watcher.watch(
+            'channel_events',
+            EVENTS_CONFIG_FILEPATH,
+            lambda events_config: parse_channel_events(events_config, CITIES)
+        ))
     if GUILD_EVENTS_CONFIG_FILEPATH is not None:
-        with open(GUILD_EVENTS_CONFIG_FILEPATH, encoding='utf-8') as f:
-            guild_events_config = json.load(f)
-        GUILDS_WITH_EVENT_CREATION_ENABLED = guild_events_config['guilds_with_event_creation_enabled']
+        GUILDS_WITH_EVENT_CREATION_ENABLED.extend(config_watcher.watch('guild_events', GUILD_EVENTS_CONFIG_FILEPATH, parse_guild_events))
     if WORLD_UPDATES_CONFIG_FILEPATH is not None:
-        with open(WORLD_UPDATES_CONFIG_FILEPATH, encoding='utf-8') as f:
-            world_updates_config = json.load(f)
-        WORLDS_WITH_STATUS_UPDATE_ENABLED = world_updates_config
+        WORLDS_WITH_STATUS_UPDATE_ENABLED.update(config_watcher.watch('world_updates', WORLD_UPDATES_CONFIG_FILEPATH, parse_world_updates))
 except Exception as e:
     sys.exit(f'Failed to load configuration: {e}')
 
-# Configure logging
+# Configure logging, records are formatted and written by a background thread
 try:
     logger = logging.getLogger(config['LOGGER_NAME'])
-    logger.setLevel(logging.DEBUG)
     if DEV_MODE: # no need for rotating logs while developing
         file_handler = logging.FileHandler(f"{_FILE_PREFIX}{config['LOG_FILE_NAME']}")
     else:
@@ -108,444 +107,1102 @@ try:
             maxBytes=2097152,
             backupCount=3
         ) # keeps up to 4 2MB logs
-    file_handler.setLevel(logging.DEBUG)
-    file_format = logging.Formatter('%(asctime)s - %(name)-16s - %(levelname)-8s - %(message)s')
-    file_handler.setFormatter(file_format)
-    logger.addHandler(file_handler)
+    log_listener = configure_logging(
+        logger,
+        file_handler,
+        level=config.get('LOG_LEVEL', 'DEBUG').upper(),
+        json_format=config.get('LOG_FORMAT', 'text').lower() == 'json'
+    )
+    if hasattr(signal, 'SIGUSR1'): # `kill -USR1 <pid>` steps through DEBUG/INFO/WARNING/ERROR
+        signal.signal(signal.SIGUSR1, lambda signum, frame: logger.warning('Log level changed to %s by SIGUSR1', cycle_log_level(logger)))
 except Exception as e:
     sys.exit(f"Could not initalize logger with name {config['LOGGER_NAME']}: {e}")
 else:
     logger.debug('Logger initialized')
 
+METRICS_SERVER = None # started once by on_ready() when METRICS_PORT is set
+LOW_MEMORY_MODE = config.get('LOW_MEMORY_MODE', 'false').lower() == 'true'
+MEMORY_REPORT_FILEPATH = f'{_FILE_PREFIX}memory_report.txt'
+if config.get('TRACEMALLOC', 'false').lower() == 'true' and not tracemalloc.is_tracing():
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+if hasattr(signal, 'SIGUSR2'): # `kill -USR2 <pid>` writes MEMORY_REPORT_FILEPATH, off the event loop
+    signal.signal(signal.SIGUSR2, lambda signum, frame: threading.Thread(
+        target=lambda: logger.warning('Wrote memory report to %s:\n%s', MEMORY_REPORT_FILEPATH, write_memory_report(MEMORY_REPORT_FILEPATH)),
+        name='memory-report',
+        daemon=True
+    ).start())
+LOOP_LAG_THRESHOLD_SECONDS = float(config.get('LOOP_LAG_THRESHOLD_MS') or 0) / 1000 # 0 disables the watchdog
+loop_watchdog = LoopWatchdog(threshold=LOOP_LAG_THRESHOLD_SECONDS or 0.25, logger=logger)
+PROFILE_MAX_SECONDS = 60
+MAX_EVENT_HORIZON_DAYS = 25 # Discord allows at most 25 choices for the /events day option
+EVENT_HORIZON_DAYS = max(2, int(config.get('EVENT_HORIZON_DAYS', '7'))) # days of events loaded, starting today
+if EVENT_HORIZON_DAYS > MAX_EVENT_HORIZON_DAYS:
+    logger.warning('EVENT_HORIZON_DAYS=%s is more than /events can offer, using %s', EVENT_HORIZON_DAYS, MAX_EVENT_HORIZON_DAYS)
+    EVENT_HORIZON_DAYS = MAX_EVENT_HORIZON_DAYS
+GUILD_EVENT_DAYS = min(EVENT_HORIZON_DAYS, max(1, int(config.get('GUILD_EVENT_DAYS', '2')))) # days of guild events created, starting today
+EVENT_DAY_OPTIONS = ['today', 'tomorrow'] + [str(day_offset) for day_offset in range(2, EVENT_HORIZON_DAYS)] # /events day values
+LOADING_RESPONSE = 'The bot is still loading siege windows and events, please try again in a minute.'
+UNRENDERED_RESPONSE = 'This response could not be built from the loaded data, please try again later.'
+ADMIN_USER_IDS = {int(user_id) for user_id in config.get('ADMIN_USER_IDS', '').split(',') if user_id.strip()}
+
 event_client = DiscordCommands(token=config['DISCORD_TOKEN'])
-bot = discord.Client(
-    intents=discord.Intents.all(),
-    activity=discord.Game(name='New World')
+guild_event_reconciler = GuildEventReconciler(
+    event_client,
+    is_managed=lambda event: is_managed_guild_event(event), # defined further down
+    max_concurrent_guilds=5,
+    logger=logger
 )
-slash = SlashCommand(bot, sync_commands=True)
-try:
-    if DEV_MODE:
-        logger.debug('Attempting to initialize dev Boto3 dynamodb session')
-        db = boto3.Session(profile_name=config['DEV_AWS_PROFILE']).client('dynamodb')
-    else:
-        logger.debug('Attempting to initialize prod Boto3 dynamodb session')
-        db = boto3.client('dynamodb', region_name=config['AWS_REGION'])
-except ClientError as e:
-    logger.exception('Failed to initalize boto3 session')
-else:
-    logger.debug('Initialized Boto3 dynamodb session')
+world_status_poller = NWWorldStatusPoller(WORLDS_WITH_STATUS_UPDATE_ENABLED)
+world_status_history = WorldStatusHistory()
+world_status_schedule = AdaptivePollSchedule()
+def build_client_options() -> dict:
+    '''Returns discord.Client options, in LOW_MEMORY_MODE only the guilds intent with member and message caching off
+
+    Slash commands arrive as interactions and channels are cached with the guilds intent, which is all the bot uses.'''
+    if not LOW_MEMORY_MODE:
+        return {'intents': discord.Intents.all()}
+    intents = discord.Intents.none()
+    intents.guilds = True
+    return {
+        'intents': intents,
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'chunk_guilds_at_startup': False,
+        'max_messages': None
+    }
+
+bot = SHARD_PLAN.create_client(
+    activity=discord.Game(name='New World'),
+    **build_client_options()
+)
+DB_LOADER = None # created by get_db_loader() on first use, boto3 client setup is slow
+EVENT_SOURCE = None # created by get_event_source() on first use
+SYNC_MARKERS = None # created by get_sync_markers() on first use when SYNC_MARKER_TABLE_NAME is set
+INCREMENTAL_REFRESH_SECONDS = max(30, int(config.get('INCREMENTAL_REFRESH_SECONDS') or '90')) # seconds between sync marker polls
+SNAPSHOT_FILEPATH = f"{_FILE_PREFIX}{config.get('SNAPSHOT_FILE_NAME', 'snapshot.json')}"
+SCHEDULER = None # created by on_ready() outside DEV_MODE
+REFRESHES = SingleFlight() # concurrent refreshes of the same data share one load
+SNAPSHOT_MTIME = None # modification time of the snapshot last read by reload_shared_snapshot()
+SNAPSHOT_SAVED_AT = None # monotonic time of the last snapshot write
+STATUS_SNAPSHOT_INTERVAL = 600 # seconds between snapshot writes while no world status changes
+MAX_CONCURRENT_SENDS = 10 # channel messages in flight at once, discord.py still waits out each channel's rate limit
+FOREIGN_CHANNEL_IDS = set() # configured channels found to belong to another process's shards
+UNLISTED_WATCHED_WORLDS = set() # worlds in world_updates.json missing from the latest status page, logged when this changes
+
+def get_db_loader() -> DynamoDBLoader:
+    '''Returns the shared DynamoDBLoader, creating the boto3 client the first time it is needed'''
+    global DB_LOADER
+    if DB_LOADER is None:
+        try:
+            if DEV_MODE:
+                logger.debug('Attempting to initialize dev Boto3 dynamodb session')
+                db = boto3.Session(profile_name=config['DEV_AWS_PROFILE']).client('dynamodb')
+            else:
+                logger.debug('Attempting to initialize prod Boto3 dynamodb session')
+                db = boto3.client('dynamodb', region_name=config['AWS_REGION'])
+        except ClientError:
+            logger.exception('Failed to initalize boto3 session')
+            raise
+        logger.debug('Initialized Boto3 dynamodb session')
+        DB_LOADER = DynamoDBLoader(db, logger=logger, max_workers=4 if LOW_MEMORY_MODE else 10)
+    return DB_LOADER
+
+def get_event_source():
+    '''Returns the event reader for the configured layout: the single EVENT_TABLE_NAME table if set, else one table per city'''
+    global EVENT_SOURCE
+    if EVENT_SOURCE is None:
+        if config.get('EVENT_TABLE_NAME'):
+            logger.debug('Reading events from single table %s', config['EVENT_TABLE_NAME'])
+            EVENT_SOURCE = SingleTableEventSource(
+                get_db_loader(),
+                config['EVENT_TABLE_NAME'],
+                CITIES,
+                city_index_name=config.get('EVENT_CITY_INDEX_NAME') or DEFAULT_CITY_INDEX_NAME,
+                logger=logger
+            )
+        else:
+            logger.debug('Reading events from per-city tables %s*', config['EVENT_TABLE_PREFIX'])
+            EVENT_SOURCE = PerCityEventSource(get_db_loader(), config['EVENT_TABLE_PREFIX'], CITIES)
+    return EVENT_SOURCE
+
+def get_sync_markers() -> SyncMarkers:
+    '''Returns the change markers in SYNC_MARKER_TABLE_NAME, or None when incremental refresh is not configured'''
+    global SYNC_MARKERS
+    if SYNC_MARKERS is None and config.get('SYNC_MARKER_TABLE_NAME'):
+        SYNC_MARKERS = SyncMarkers(get_db_loader(), config['SYNC_MARKER_TABLE_NAME'], [*CITIES, SIEGE_WINDOW_SOURCE])
+    return SYNC_MARKERS
 
 @bot.event
 async def on_ready():
     '''This function is activated when the bot reaches a 'ready' state.'''
-    logger.info('Bot is ready')
+    logger.info('Bot is ready (%s, data %s)', SHARD_PLAN.describe(), 'leader' if SHARD_PLAN.is_data_leader else 'follower')
+    global METRICS_SERVER, SCHEDULER
+    if METRICS_SERVER is None and config.get('METRICS_PORT'):
+        try:
+            METRICS_SERVER = await start_metrics_server(REGISTRY, port=int(config['METRICS_PORT']))
+        except OSError as e:
+            logger.error('Failed to start metrics server on port %s: %s', config['METRICS_PORT'], e)
+        else:
+            logger.info('Serving metrics on http://127.0.0.1:%s/metrics', config['METRICS_PORT'])
+    if SCHEDULER is not None and SCHEDULER.running: # on_ready runs again after every reconnect
+        logger.info('Reconnected, keeping the running scheduler and loaded data')
+        return
     if not DEV_MODE:
         try: # scheduler startup
             logger.debug('Attempting to start scheduler')
-            scheduler = AsyncIOScheduler()
-            for channel in CHANNELS_WITH_ANNOUNCE_ENABLED:
-                logger.debug(f'Adding job to scheduler for announcements in {str(channel)}')
-                job_hour = CHANNELS_WITH_ANNOUNCE_ENABLED[channel]['hour']
-                job_minute = CHANNELS_WITH_ANNOUNCE_ENABLED[channel]['minute']
-                job_city = CHANNELS_WITH_ANNOUNCE_ENABLED[channel]['city']
+            scheduler = AsyncIOScheduler(timezone=SERVER_TIMEZONE_NAME)
+            SCHEDULER = scheduler
+            sync_announcement_jobs()
+            sync_world_status_job()
+            logger.debug('Adding job to apply config file edits every 30 seconds')
+            scheduler.add_job(
+                reload_config_files,
+                'interval',
+                seconds=30,
+                id='config-reload'
+            )
+            logger.debug('Adding job to check the world status poll is still scheduled every 10 minutes')
+            scheduler.add_job(
+                rearm_world_status_job,
+                'interval',
+                minutes=10,
+                id='world-status-rearm'
+            )
+            if SHARD_PLAN.is_data_leader:
+                logger.debug('Adding job to refresh invasion data daily at midnight')
                 scheduler.add_job(
-                    send_city_event_announcement,
-                    trigger=CronTrigger(
-                        hour=str(job_hour),
-                        minute=str(job_minute),
-                        second="0"
-                        ),
-                    args=[int(channel), job_city]
-                )
-            for world in WORLDS_WITH_STATUS_UPDATE_ENABLED:
-                logger.debug(f'Adding job to scheduler for world status updates for {world}')
-                job_channel_list = WORLDS_WITH_STATUS_UPDATE_ENABLED[world]
-                job_update_client = NWWorldStatusClient('us-east', world)
+                    refresh_event_data,
+                    trigger=CronTrigger(hour="0", minute="0", second="1")
+                ) # daily task at midnight
+                logger.debug('Adding job to refresh siege windows daily 15 minutes after midnight')
                 scheduler.add_job(
-                    send_world_status_if_changed,
+                    refresh_siege_window,
+                    trigger=CronTrigger(hour="0", minute="15", second="0")
+                ) # daily task at 00:15, re-sorts the loaded events without reloading them
+                if get_sync_markers() is not None:
+                    logger.debug('Adding job to reload changed cities every %s seconds', INCREMENTAL_REFRESH_SECONDS)
+                    scheduler.add_job(
+                        refresh_changed_data,
+                        'interval',
+                        seconds=INCREMENTAL_REFRESH_SECONDS,
+                        id='incremental-refresh'
+                    )
+            else:
+                logger.debug('Adding job to pick up the data leader\'s snapshot every minute')
+                scheduler.add_job(
+                    reload_shared_snapshot,
                     'interval',
-                    minutes=1,
-                    args=[job_channel_list, job_update_client, world]
+                    minutes=1
                 )
-            logger.debug('Adding job to refresh invasion data daily at midnight')
-            scheduler.add_job(
-                refresh_event_data,
-                trigger=CronTrigger(hour="0", minute="0", second="1")
-            ) # daily task at midnight
-            logger.debug('Adding job to refresh siege windows daily 15 minutes after midnight')
-            scheduler.add_job(
-                refresh_siege_window,
-                trigger=CronTrigger(hour="0", minute="15", second="0")
-            ) # daily task at 00:15
-            logger.debug('Adding job to refresh invasion data daily 15 minutes after midnight')
-            scheduler.add_job(
-                refresh_event_data,
-                trigger=CronTrigger(hour="0", minute="15", second="0")
-            ) # daily task at 00:15
             logger.debug('Adding job to update guild events daily 20 minutes after midnight')
             scheduler.add_job(
                 update_guild_events,
                 trigger=CronTrigger(hour="0", minute="20", second="0")
             ) # daily task at 00:15
+            register_scheduler_metrics(scheduler)
             scheduler.start()
         except Exception as sched_exception:
-            logger.exception(f'Failed to start scheduler: {sched_exception}')
+            logger.exception('Failed to start scheduler: %s', sched_exception)
         else:
             logger.debug('Initialized scheduler successfully')
-            await refresh_siege_window()
-            await refresh_event_data()
-            await update_guild_events()
+            # commands are answered from the warm-start snapshot while this runs
+            bot.loop.create_task(refresh_all_data())
             logger.debug('Completed on ready')
 
-async def clear_event_data_lists() -> None:
-    '''This clears UPCOMING_EVENT_INFO list'''
-    # Need a better way to do this, doing it within the refresh function
-    # causes a scoping issue with the variable
-    TODAYS_CITIES_WITH_EVENTS.clear()
-    TOMORROWS_CITIES_WITH_EVENTS.clear()
-    UPCOMING_EVENT_INFO.clear()
-
-async def convert_time_str_to_min_sec(hour) -> int:
-    '''Intakes a string with style 08:30 PM and returns 24-hour format time int: 20'''
-    in_hour = int(hour.split(':')[0]) # split 08:30 PM style string to 08
-    in_minute = int(hour.split(':')[1].split(' ')[0]) # split 8:30 PM style string to 30
-    in_ampm = hour.split(' ')[1] # split 08:30 PM style string to PM
-    if in_ampm == 'PM':
-        in_hour += 12
-    return in_hour, in_minute
-
-async def get_all_event_string(day: str = None) -> str:
-    '''Returns a string detailing the server's events on [day] or today/tomorrow if [day=None]'''
-    if day == 'today' or day is None:
-        today_event_text = []
-        if TODAYS_CITIES_WITH_EVENTS: # if any events today
-            todays_cities_and_windows = {}
-            for today_city in TODAYS_CITIES_WITH_EVENTS:
-                if await is_hour_in_future(CITY_INFO[today_city]['siege_time']):
-                    todays_cities_and_windows[today_city] = CITY_INFO[today_city]['siege_time']
-            sorted_partial = sorted(todays_cities_and_windows, key = todays_cities_and_windows.get)
-            for key in sorted_partial:
-                today_event_text.append(f"    {CITY_INFO[key]['siege_time']} EST - {str(UPCOMING_EVENT_INFO[key]['event_type']).capitalize()} in {key}")
-        # determine today's response
-        if len(today_event_text) > 1:
-            today_invasion_str = '\n'.join(today_event_text)
-            today_response = f'**Today there are {str(len(today_event_text))} events:**\n{today_invasion_str}'
-        elif len(today_event_text) == 1:
-            today_response = f'**Today there is 1 event:**\n{today_event_text[0]}'
+def sync_announcement_jobs() -> None:
+    '''Adds and removes scheduler jobs so there is exactly one announcement job per configured (hour, minute)'''
+    desired_slots = {
+        f"announcements-{channel['hour']:02d}:{channel['minute']:02d}": (channel['hour'], channel['minute'])
+        for channel in CHANNELS_WITH_ANNOUNCE_ENABLED.values()
+    }
+    existing_job_ids = {job.id for job in SCHEDULER.get_jobs() if job.id.startswith('announcements-')}
+    for job_id in sorted(existing_job_ids - desired_slots.keys()):
+        logger.debug('Removing announcement job %s, no channels left in the slot', job_id)
+        SCHEDULER.remove_job(job_id)
+    for job_id in sorted(desired_slots.keys() - existing_job_ids):
+        job_hour, job_minute = desired_slots[job_id]
+        logger.debug('Adding job to scheduler for announcements at %02d:%02d', job_hour, job_minute)
+        SCHEDULER.add_job(
+            send_slot_announcements,
+            trigger=CronTrigger(
+                hour=str(job_hour),
+                minute=str(job_minute),
+                second="0"
+                ),
+            args=[job_hour, job_minute],
+            id=job_id
+        )
+
+def sync_world_status_job() -> None:
+    '''Adds the world status polling job if any world is watched, removes it if none are'''
+    job = SCHEDULER.get_job('world-status')
+    if WORLDS_WITH_STATUS_UPDATE_ENABLED and job is None:
+        logger.debug('Adding job to scheduler for world status updates for %s', list(WORLDS_WITH_STATUS_UPDATE_ENABLED))
+        schedule_world_status_poll(0) # record initial statuses right away
+    elif not WORLDS_WITH_STATUS_UPDATE_ENABLED and job is not None:
+        logger.debug('Removing world status job, no worlds are watched')
+        SCHEDULER.remove_job('world-status')
+
+def schedule_world_status_poll(delay: float) -> None:
+    '''Runs refresh_world_statuses() once in [delay] seconds, each run schedules the next one from world_status_schedule'''
+    SCHEDULER.add_job(
+        refresh_world_statuses,
+        'date',
+        run_date=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=delay),
+        id='world-status',
+        replace_existing=True,
+        misfire_grace_time=None, # a late poll still runs, it is the only thing that schedules the next one
+        coalesce=True
+    )
+
+def rearm_world_status_job() -> None:
+    '''Schedules a world status poll if worlds are watched but no poll is scheduled or running, e.g. after the job was lost'''
+    if WORLDS_WITH_STATUS_UPDATE_ENABLED and SCHEDULER.get_job('world-status') is None and not REFRESHES.in_flight('world-status'):
+        logger.warning('No world status poll was scheduled, polling now')
+        schedule_world_status_poll(0)
+
+async def reload_config_files() -> None:
+    '''Applies edits to channel_events.json, guild_events.json and world_updates.json without reconnecting
+
+    Only the affected announcement jobs and world watches change, and only newly added guilds get events
+    created right away. Invalid edits are logged and ignored.'''
+    changes = await asyncio.get_event_loop().run_in_executor(None, config_watcher.changed)
+    if 'channel_events' in changes:
+        channels_with_announce_enabled = changes['channel_events']
+        changed_channels = {
+            channel_id for channel_id in CHANNELS_WITH_ANNOUNCE_ENABLED.keys() | channels_with_announce_enabled.keys()
+            if CHANNELS_WITH_ANNOUNCE_ENABLED.get(channel_id) != channels_with_announce_enabled.get(channel_id)
+        }
+        logger.info('channel_events.json changed, %s announcement channels added, removed or rescheduled', len(changed_channels))
+        CHANNELS_WITH_ANNOUNCE_ENABLED.clear()
+        CHANNELS_WITH_ANNOUNCE_ENABLED.update(channels_with_announce_enabled)
+        FOREIGN_CHANNEL_IDS.difference_update(int(channel_id) for channel_id in changed_channels)
+        sync_announcement_jobs()
+    if 'world_updates' in changes:
+        worlds_with_status_update_enabled = changes['world_updates']
+        logger.info(
+            'world_updates.json changed, watching %s worlds (added %s, removed %s)',
+            len(worlds_with_status_update_enabled),
+            sorted(worlds_with_status_update_enabled.keys() - WORLDS_WITH_STATUS_UPDATE_ENABLED.keys()),
+            sorted(WORLDS_WITH_STATUS_UPDATE_ENABLED.keys() - worlds_with_status_update_enabled.keys())
+        )
+        WORLDS_WITH_STATUS_UPDATE_ENABLED.clear()
+        WORLDS_WITH_STATUS_UPDATE_ENABLED.update(worlds_with_status_update_enabled)
+        world_status_poller.set_watched_worlds(WORLDS_WITH_STATUS_UPDATE_ENABLED)
+        sync_world_status_job()
+    if 'guild_events' in changes:
+        added_guild_ids = [guild_id for guild_id in changes['guild_events'] if guild_id not in GUILDS_WITH_EVENT_CREATION_ENABLED]
+        logger.info('guild_events.json changed, event creation enabled for %s guilds (%s new)', len(changes['guild_events']), len(added_guild_ids))
+        GUILDS_WITH_EVENT_CREATION_ENABLED[:] = changes['guild_events']
+        if added_guild_ids:
+            await update_guild_events(added_guild_ids)
+
+async def refresh_all_data() -> None:
+    '''Refreshes siege windows and events from dynamodb, then brings guild events up to date'''
+    try:
+        if SHARD_PLAN.is_data_leader:
+            await refresh_siege_window()
+            await refresh_event_data()
         else:
-            today_response = '**There are no events happening today!**'
-    if day == 'tomorrow' or day is None:
-        tomorrow_event_text = []
-        if TOMORROWS_CITIES_WITH_EVENTS: # if any events today
-            tomorrows_cities_and_windows = {}
-            for tomorrow_city in TOMORROWS_CITIES_WITH_EVENTS:
-                if await is_hour_in_future(CITY_INFO[tomorrow_city]['siege_time']):
-                    tomorrows_cities_and_windows[tomorrow_city] = CITY_INFO[tomorrow_city]['siege_time']
-            sorted_partial = sorted(tomorrows_cities_and_windows, key = tomorrows_cities_and_windows.get)
-            for key in sorted_partial:
-                tomorrow_event_text.append(f"    {CITY_INFO[key]['siege_time']} EST - {str(UPCOMING_EVENT_INFO[key]['event_type']).capitalize()} in {key}")
-        # determine tomorrow's response
-        if len(tomorrow_event_text) > 1:
-            tomorrow_invasion_str = '\n'.join(tomorrow_event_text)
-            tomorrow_response = f'**Tomorrow there are {str(len(tomorrow_event_text))} events:**\n{tomorrow_invasion_str}'
-        elif len(tomorrow_event_text) == 1:
-            tomorrow_response = f'**Tomorrow there is 1 event:**\n{tomorrow_event_text[0]}'
+            await reload_shared_snapshot()
+        await update_guild_events()
+    except Exception:
+        logger.exception('Failed to refresh data after startup, serving the last snapshot until the next scheduled refresh')
+
+def register_scheduler_metrics(scheduler: AsyncIOScheduler) -> None:
+    '''Records how late each scheduler job starts and how each run ends'''
+    lateness = REGISTRY.histogram('scheduler_job_lateness_seconds', 'Delay between a job\'s scheduled and actual start')
+    outcomes = REGISTRY.counter('scheduler_job_runs_total', 'Scheduler job runs by outcome')
+    outcome_names = {EVENT_JOB_EXECUTED: 'executed', EVENT_JOB_ERROR: 'error', EVENT_JOB_MISSED: 'missed'}
+
+    def on_job_event(event):
+        job = scheduler.get_job(event.job_id)
+        job_name = job.name if job is not None else event.job_id
+        if event.code == EVENT_JOB_SUBMITTED:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            for run_time in event.scheduled_run_times:
+                lateness.observe((now - run_time).total_seconds(), job=job_name)
         else:
-            tomorrow_response = '**There are no events happening tomorrow!**'
+            outcomes.inc(job=job_name, outcome=outcome_names[event.code])
+
+    scheduler.add_listener(on_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+def event_day_date(day: str) -> datetime.date:
+    '''Returns the date for a /events [day] value: today, tomorrow, or a number of days from today'''
+    if day == 'today':
+        return server_today()
+    if day == 'tomorrow':
+        return server_today() + datetime.timedelta(days=1)
+    return server_today() + datetime.timedelta(days=int(day))
+
+def describe_event_day(date: datetime.date) -> str:
+    '''Returns today, tomorrow or e.g. on Monday, October 19 for [date]'''
+    day_offset = (date - server_today()).days
+    if day_offset == 0:
+        return 'today'
+    if day_offset == 1:
+        return 'tomorrow'
+    return f"on {date.strftime('%A, %B')} {date.day}"
+
+def describe_siege_time(data: BotData, city: str) -> str:
+    '''Returns [city]'s siege time for a response, e.g. 08:30 PM EST, or unknown time if its window is not loaded'''
+    return f'{data.schedule.label(city)} EST' if city in data.schedule else 'unknown time'
+
+def is_siege_in_future(data: BotData, city: str) -> bool:
+    '''Returns True if [city]'s siege window has not started yet today, or is not loaded so it may still come'''
+    return city not in data.schedule or data.schedule.is_in_future(city)
+
+def describe_event_type(event) -> str:
+    '''Returns an invasion or a war for [event]'''
+    return 'an invasion' if event.event_type.capitalize() == 'Invasion' else 'a war'
+
+async def get_day_event_string(data: BotData, date: datetime.date) -> str:
+    '''Returns a string listing the server's events on [date] in siege time order, today only lists events still to come'''
+    day_text = describe_event_day(date)
+    if not data.events.covers(date):
+        return f'**Events {day_text} have not been loaded yet!**'
+    day_events = data.events.on(date)
+    if date == server_today():
+        day_events = [event for event in day_events if is_siege_in_future(data, event.city)]
+    event_text = [f"    {describe_siege_time(data, event.city)} - {event.event_type.capitalize()} in {event.city}" for event in day_events]
+    heading = day_text[0].upper() + day_text[1:]
+    if len(event_text) > 1:
+        event_list_str = '\n'.join(event_text)
+        return f'**{heading} there are {len(event_text)} events:**\n{event_list_str}'
+    if len(event_text) == 1:
+        return f'**{heading} there is 1 event:**\n{event_text[0]}'
+    return f'**There are no events happening {day_text}!**'
+
+async def get_all_event_string(data: BotData, day: str = None) -> str:
+    '''Returns a string detailing the server's events on [day] or today/tomorrow if [day=None]'''
     if day is None:
-        response = today_response + '\n' + tomorrow_response
-    elif day == 'today':
-        response = today_response
-    elif day == 'tomorrow':
-        response = tomorrow_response
-
-    return response
-
-async def get_city_event_string(city, day=None) -> str:
-    '''Returns a string detailing event status for a [city] on [day] or both today/tomorrow if [day=None](default)'''
-    siege_window_in_future = await is_hour_in_future(CITY_INFO[city]['siege_time'])
-    if city in UPCOMING_EVENT_INFO and 'event_type' in UPCOMING_EVENT_INFO[city]:
-        if str(UPCOMING_EVENT_INFO[city]['event_type']).capitalize() == 'Invasion':
-            event_str = 'an invasion'
-        else:
-            event_str = 'a war'
-    if day is None: # both days
-        # if event later and it is not siege time yet
-        if (city in TODAYS_CITIES_WITH_EVENTS) and siege_window_in_future:
-            duration_str = await get_time_til_hour(CITY_INFO[city]['siege_time'])
-            response = f"{city} has {event_str} later today in {duration_str} at {CITY_INFO[city]['siege_time']} EST"
-        # if event happened earlier today
-        if (city in TODAYS_CITIES_WITH_EVENTS) and not siege_window_in_future:
-            response = f"{city} had {event_str} earlier today at {CITY_INFO[city]['siege_time']} EST"
-        # if event is tomorrow
-        if city in TOMORROWS_CITIES_WITH_EVENTS:
-            response = f"{city} has {event_str} tomorrow at {CITY_INFO[city]['siege_time']} EST"
-        # if no events next two days
-        if (city not in TODAYS_CITIES_WITH_EVENTS) and (city not in TOMORROWS_CITIES_WITH_EVENTS):
-            response = f"{city} does not have any events today or tomorrow!"
-    elif day == 'tomorrow': # tomorrow
-        if city in TOMORROWS_CITIES_WITH_EVENTS:
-            response = f"{city} has {event_str} tomorrow at {CITY_INFO[city]['siege_time']} EST"
-        else:
-            response = f"{city} does not have any events tomorrow!"
-    else: # assume today otherwise
-        # if event later and it is not siege time yet
-        if (city in TODAYS_CITIES_WITH_EVENTS) and siege_window_in_future:
-            duration_str = await get_time_til_hour(CITY_INFO[city]['siege_time'])
-            response = f"{city} has {event_str} later today in {duration_str} at {CITY_INFO[city]['siege_time']} EST"
-        # if event happened earlier today
-        if (city in TODAYS_CITIES_WITH_EVENTS) and not siege_window_in_future:
-            response = f"{city} had {event_str} earlier today at {CITY_INFO[city]['siege_time']} EST"
-        # if no event today
-        if city not in TODAYS_CITIES_WITH_EVENTS:
-            response = f"{city} does not have any events today!"
-    return response
-
-async def get_time_til_hour(hour) -> str:
-    '''Returns a string with style 1h1m with the duration from now until [hour] with style 08:30 PM'''
-    logger.debug(f'Attempting to get_time_til_hour() for: {hour}')
-    hour_int, minute_int = await convert_time_str_to_min_sec(hour)
-    hour_24fmt = datetime.date.today().strftime('%Y-%m-%d') + \
-         f' {str(hour_int)}:{str(minute_int)}:00'
-    now_24fmt = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    hour_obj = datetime.datetime.strptime(hour_24fmt, '%Y-%m-%d %H:%M:%S')
-    now_obj = datetime.datetime.strptime(now_24fmt, '%Y-%m-%d %H:%M:%S')
-    time_delta_seconds = (hour_obj - now_obj).total_seconds()
-    duration_hours = math.floor(time_delta_seconds / 3600)
-    remaining_seconds = time_delta_seconds - (duration_hours * 3600)
-    duration_minutes = math.ceil(remaining_seconds / 60)
-    if duration_minutes == 60:
-        duration_hours += 1
-        duration_minutes = 0
-    logger.debug(f'Completed get_time_til_hour() with result: {duration_hours}h{duration_minutes}m')
-    return f'{duration_hours}h{duration_minutes}m'
-
-async def is_hour_in_future(hour) -> bool:
-    '''Returns a bool that is True if [hour] is after now. Standard format: 8:00 PM'''
-    logger.debug(f'Attempting to is_hour_in_future() for: {hour}')
-    hour_int, minute_int = await convert_time_str_to_min_sec(hour)
-    logger.debug(f'Converted hour to {hour_int}, minute to {minute_int}')
-    if hour_int <1 or hour_int > 24 or not isinstance(hour_int, int):
-        logger.exception(f'Cannot operate on hour: {hour_int}')
-    time_now = datetime.datetime.now()
-    time_hour = time_now.replace(hour=hour_int, minute=minute_int)
-    result = time_now < time_hour
-    logger.debug(f'Completed is_hour_in_future() with hour {hour_int}:{minute_int} and got result: {result}')
-    return result
+        return await get_day_event_string(data, event_day_date('today')) + '\n' + await get_day_event_string(data, event_day_date('tomorrow'))
+    return await get_day_event_string(data, event_day_date(day))
+
+async def get_city_event_string(data: BotData, city, day=None) -> str:
+    '''Returns a string detailing event status for a [city] on [day] or both today/tomorrow if [day=None](default)
+
+    Time until a later event is left as COUNTDOWN_PLACEHOLDER, see render_command_responses()'''
+    today = server_today()
+    if day is None or day == 'today':
+        if not data.events.covers(today):
+            return f'Events for {city} today have not been loaded yet!'
+        responses = []
+        todays_event = data.events.get(today, city)
+        if todays_event is not None:
+            if city not in data.schedule: # no countdown without a siege window
+                responses.append(f"{city} has {describe_event_type(todays_event)} today at {describe_siege_time(data, city)}")
+            elif data.schedule.is_in_future(city): # event later and it is not siege time yet
+                responses.append(f"{city} has {describe_event_type(todays_event)} later today in {COUNTDOWN_PLACEHOLDER} at {describe_siege_time(data, city)}")
+            else:
+                responses.append(f"{city} had {describe_event_type(todays_event)} earlier today at {describe_siege_time(data, city)}")
+        if day is None:
+            tomorrows_event = data.events.get(event_day_date('tomorrow'), city)
+            if tomorrows_event is not None:
+                responses.append(f"{city} has {describe_event_type(tomorrows_event)} tomorrow at {describe_siege_time(data, city)}")
+            return '\n'.join(responses) or f'{city} does not have any events today or tomorrow!'
+        return '\n'.join(responses) or f'{city} does not have any events today!'
+    date = event_day_date(day)
+    day_text = describe_event_day(date)
+    event = data.events.get(date, city)
+    if event is not None:
+        return f"{city} has {describe_event_type(event)} {day_text} at {describe_siege_time(data, city)}"
+    if not data.events.covers(date):
+        return f'Events for {city} {day_text} have not been loaded yet!'
+    return f'{city} does not have any events {day_text}!'
+
+async def get_time_til_siege(city: str) -> str:
+    '''Returns a string with style 1h1m with the duration from now until [city]'s siege window today'''
+    return format_duration(DATA.schedule.time_until(city))
+
+async def render_response(key: tuple, response_coroutine) -> str:
+    '''Returns the awaited response text for [key], or UNRENDERED_RESPONSE if rendering it failed, so one bad response does not break the rest'''
+    try:
+        return await response_coroutine
+    except (KeyError, ValueError) as e:
+        logger.error('Failed to render response %s: %r', key, e)
+        return UNRENDERED_RESPONSE
+
+async def render_command_responses() -> tuple:
+    '''Renders every /events and /windows response from one DATA, returns ({key: (text, countdown siege time)}, expiry)'''
+    logger.debug('Attempting to render_command_responses()')
+    data = DATA # a refresh publishing mid-render does not mix old and new data
+    responses = {}
+    for day in [None] + EVENT_DAY_OPTIONS:
+        responses[('events', None, day)] = (await render_response(('events', None, day), get_all_event_string(data, day)), None)
+        for city in CITIES:
+            city_response = await render_response(('events', city, day), get_city_event_string(data, city, day))
+            countdown_target = city if COUNTDOWN_PLACEHOLDER in city_response else None
+            responses[('events', city, day)] = (city_response, countdown_target)
+    if data.schedule.siege_times():
+        window_texts = ['The server siege windows are:']
+        for city in sorted(CITIES):
+            window_texts.append(f"{city: <32} {describe_siege_time(data, city)}")
+        responses[('windows',)] = ('\n'.join(window_texts), None)
+    else:
+        responses[('windows',)] = (LOADING_RESPONSE, None)
+    expiry = data.schedule.next_change()
+    logger.debug('Rendered %s responses, valid until %s', len(responses), expiry)
+    return responses, expiry
 
 async def refresh_event_data() -> None:
-    '''Clears locally cached event lists and gets event status from dynamodb for all cities'''
+    '''Reloads every city's events, concurrent calls share one load_event_data()'''
+    await REFRESHES.run('events', load_event_data)
+
+async def load_event_data() -> None:
+    '''Gets events from dynamodb for all cities for the next EVENT_HORIZON_DAYS days, then publishes them in a new DATA'''
     logger.debug('Attempting to refresh_event_data()')
-    await clear_event_data_lists()
-
-    for c_name in list(CITY_INFO.keys()):
-        logger.debug(f'Refreshing data in {c_name}')
-        city_name = ''.join(e for e in c_name if e.isalnum()).lower()
-        city_db_table = f"{config['EVENT_TABLE_PREFIX']}{city_name}"
-        # Get today's events
-        logger.debug(f"Attempting to find today's events in table: {city_db_table}")
-        today_search_date = str(datetime.date.today().strftime('%Y-%m-%d'))
-        response = db.get_item(
-            TableName=city_db_table,
-            Key = {
-                'date': {'S': str(today_search_date)}
-            }
-        )
-        logger.debug(f'Response from db: {response}')
-        if 'Item' in response:
-            logger.debug(f"Determined event happening today in {c_name}")
-            UPCOMING_EVENT_INFO[c_name] = {
-                'event_type': response['Item']['type']['S'],
-                'event_date': str(today_search_date),
-                'event_attacker': response['Item']['attacker']['S'],
-                'event_defender': response['Item']['defender']['S']
-            }
-            TODAYS_CITIES_WITH_EVENTS.append(c_name)
-        else:
-            logger.debug(f"Determined no event is happening today in {c_name}")
-        # Get tomorrow's invasions
-        logger.debug(f"Attempting to find tomorrow's events in table: {city_db_table}")
-        tomorrow_search_date = str((datetime.date.today() + datetime.timedelta(days=1)).strftime('%Y-%m-%d'))
-        response = db.get_item(
-            TableName=city_db_table,
-            Key = {
-                'date': {'S': str(tomorrow_search_date)}
-            }
-        )
-        logger.debug(f'Response from db: {response}')
-        if 'Item' in response:
-            logger.debug(f"Determined event happening today in {c_name}")
-            UPCOMING_EVENT_INFO[c_name] = {
-                'event_type': response['Item']['type']['S'],
-                'event_date': str(tomorrow_search_date),
-                'event_attacker': response['Item']['attacker']['S'],
-                'event_defender': response['Item']['defender']['S']
-            }
-            TOMORROWS_CITIES_WITH_EVENTS.append(c_name)
-        else:
-            logger.debug(f"Determined no event is happening tomorrow in {c_name}")
+    start_date = server_today()
+    logger.debug('Attempting to find events for %s days from %s', EVENT_HORIZON_DAYS, start_date)
+    sync_markers = get_sync_markers()
+    marker_versions = await sync_markers.read() if sync_markers is not None else {}
+    loaded_events = await get_event_source().load(start_date, EVENT_HORIZON_DAYS)
+    logger.debug('Received %s events from db', len(loaded_events))
+    if sync_markers is not None:
+        sync_markers.mark_synced({source: version for source, version in marker_versions.items() if source in CITIES})
+
+    global DATA
+    DATA = DATA.with_events(EventStore(loaded_events, start_date, EVENT_HORIZON_DAYS))
+    for event in DATA.events.events():
+        logger.debug('Determined %s happening in %s on %s', event.event_type, event.city, event.date)
 
+    await rebuild_response_cache()
+    await save_state_snapshot()
     logger.debug('Completed running refresh_event_data()')
 
-async def refresh_siege_window(city:str = None) -> None:
-    '''Gets siege window data from dynamodb for [city] or all cities if [city=None] (default)'''
-    logger.debug(f'Attempting to refresh_siege_window({city})')
+async def refresh_siege_window(city: str = None) -> None:
+    '''Reloads siege windows for [city] or all cities, concurrent calls share one load_siege_window() and a running reload of all cities covers any one city'''
+    if city:
+        await REFRESHES.run(f'siege-windows:{city}', load_siege_window, city, covered_by='siege-windows')
+    else:
+        await REFRESHES.run('siege-windows', load_siege_window)
+
+async def load_siege_window(city: str = None) -> None:
+    '''Gets siege window data from dynamodb for [city] or all cities if [city=None] (default), then publishes them in a new DATA'''
+    logger.debug('Attempting to refresh_siege_window(%s)', city)
     table_name = config['SIEGE_INFO_TABLE_NAME']
 
     if city:
         cities_to_refresh = [city]
     else:
-        cities_to_refresh = list(CITY_INFO.keys())
-
-    for city_name in cities_to_refresh:
-        logger.debug(f'Refreshing data in {city_name}')
-        response = db.get_item(
-            TableName=table_name,
-            Key = {
-                'city': {'S': city_name}
-            }
-        )
-        CITY_INFO[city_name]['siege_time'] = response['Item']['time']['S']
-        logger.debug(f"Determined siege time in {city_name}: {CITY_INFO[city_name]['siege_time']}")
+        cities_to_refresh = list(CITIES)
+
+    sync_markers = get_sync_markers() if not city else None
+    marker_versions = await sync_markers.read() if sync_markers is not None else {}
+    response = await get_db_loader().batch_get_items({
+        table_name: [{'city': {'S': city_name}} for city_name in cities_to_refresh]
+    })
+    if sync_markers is not None:
+        sync_markers.mark_synced({SIEGE_WINDOW_SOURCE: marker_versions[SIEGE_WINDOW_SOURCE]})
+    siege_times = {}
+    for item in response[table_name]:
+        siege_times[item['city']['S']] = item['time']['S']
+        logger.debug("Determined siege time in %s: %s", item['city']['S'], item['time']['S'])
+    global DATA
+    DATA = DATA.with_siege_times(siege_times)
+    missing_cities = set(cities_to_refresh) - siege_times.keys()
+    if missing_cities:
+        logger.error('No siege window found in %s for: %s', table_name, sorted(missing_cities))
+    await rebuild_response_cache()
+    await save_state_snapshot()
     logger.debug('Completed running refresh_siege_window()')
 
-async def send_city_event_announcement(int_channel_id: int, city: str):
-    '''Sends a city event announcement to [channel] for [city]. See channel_events.json'''
-    logger.debug(f'Attempting to send_city_invasion_announcement() to channel: {str(int_channel_id)} for city: {city}')
-    if city in UPCOMING_EVENT_INFO:
-        if UPCOMING_EVENT_INFO[city]['event_date'] == str(datetime.date.today().strftime('%Y-%m-%d')):
-            announcement_channel = bot.get_channel(int_channel_id)
-            allowed_mentions = discord.AllowedMentions(everyone=True)
-            announcement_message = \
-                f"@everyone don't forget to sign up for the {UPCOMING_EVENT_INFO[city]['event_type']} today in {city} at {CITY_INFO[city]['siege_time']}. " + \
-                'Remember to sign up early to help ensure you get a spot!'
-            logger.debug(f"Sending announcement message for {city} to {str(int_channel_id)}")
-            await announcement_channel.send(announcement_message, allowed_mentions=allowed_mentions)
+async def refresh_changed_data() -> None:
+    '''Reloads only the cities and siege windows whose sync marker changed since they were last loaded
+
+    Costs one BatchGetItem of the markers per run, plus one city's EVENT_HORIZON_DAYS days for each changed city.'''
+    if DATA.events.start_date != server_today():
+        logger.debug('Skipping incremental refresh, events are from %s and the daily refresh has not run yet', DATA.events.start_date)
+        return
+    changes = await get_sync_markers().changed()
+    if not changes:
+        return
+    logger.info('Sync markers changed for: %s', sorted(changes))
+    previous_guild_events = build_guild_event_payloads()
+    if SIEGE_WINDOW_SOURCE in changes:
+        await refresh_siege_window()
+    changed_cities = [city for city in changes if city in CITIES]
+    if changed_cities:
+        if not await load_city_events(changed_cities):
+            return
+        get_sync_markers().mark_synced({city: changes[city] for city in changed_cities})
+    if build_guild_event_payloads() != previous_guild_events:
+        await update_guild_events()
+
+async def refresh_city_events(city: str) -> None:
+    '''Reloads [city]'s events for the loaded days, concurrent calls share one load and a running refresh_event_data() covers it'''
+    if DATA.events.start_date != server_today(): # the loaded days are stale, reload every city instead
+        await refresh_event_data()
+        return
+    await REFRESHES.run(f'events:{city}', load_city_events, [city], covered_by='events')
+
+async def load_city_events(cities: list) -> bool:
+    '''Reloads the loaded days of events for [cities] only and publishes them in a new DATA
+
+    Returns False, publishing nothing, if a full refresh replaced the events while they loaded.'''
+    global DATA
+    loaded_range = DATA.events.start_date, DATA.events.days
+    event_source = get_event_source()
+    city_events = await asyncio.gather(*(event_source.load_city(city, *loaded_range) for city in cities))
+    if (DATA.events.start_date, DATA.events.days) != loaded_range:
+        logger.debug('Dropping reloaded events for %s, a full refresh replaced the events meanwhile', cities)
+        return False
+    event_store = DATA.events
+    for city, loaded_events in zip(cities, city_events):
+        if event_store.city_events(city) != sorted(loaded_events, key=lambda event: event.date):
+            logger.info('Events changed in %s', city)
+        event_store = event_store.with_city_events(city, loaded_events)
+    DATA = DATA.with_events(event_store)
+    await rebuild_response_cache()
+    await save_state_snapshot()
+    return True
+
+async def rebuild_response_cache() -> None:
+    '''Re-renders cached command responses, or defers that to the next command if data is still incomplete'''
+    try:
+        await response_cache.rebuild()
+    except (KeyError, ValueError) as e: # siege windows not loaded yet, or not parseable
+        logger.debug('Deferring response cache rebuild, could not render: %r', e)
+        response_cache.invalidate()
+
+response_cache = ResponseCache(render_command_responses, get_time_til_siege)
+
+async def get_cached_response(key: tuple) -> str:
+    '''Returns the cached response for [key], or LOADING_RESPONSE if it cannot be rendered from the data loaded so far'''
+    try:
+        return await response_cache.get(key)
+    except (KeyError, ValueError) as e:
+        logger.warning('Answering %s with the loading message, could not render: %r', key, e)
+        return LOADING_RESPONSE
+
+def build_state_snapshot() -> dict:
+    '''Returns the cached siege, event and world status data as plain JSON-serializable values'''
+    data = DATA
+    return {
+        'siege_times': data.schedule.siege_times(),
+        'event_store': data.events.to_dict(),
+        'world_status': world_status_poller.world_status,
+        'world_status_history': world_status_history.to_dict()
+    }
+
+async def save_state_snapshot() -> None:
+    '''Writes the cached data to SNAPSHOT_FILEPATH, serialized here and written to disk on a worker thread
+
+    Only the data leader writes, other shard processes read its snapshot with reload_shared_snapshot().'''
+    global SNAPSHOT_SAVED_AT
+    if not SHARD_PLAN.is_data_leader:
+        return
+    SNAPSHOT_SAVED_AT = time.monotonic()
+    payload = dump_snapshot(build_state_snapshot())
+    try:
+        await asyncio.get_event_loop().run_in_executor(None, write_snapshot, SNAPSHOT_FILEPATH, payload)
+    except OSError as e:
+        logger.error('Failed to write snapshot to %s: %s', SNAPSHOT_FILEPATH, e)
     else:
-        logger.debug(f'Determined {city} does not have an invasion today, no announcement needed.')
+        logger.debug('Wrote %s byte snapshot to %s', len(payload), SNAPSHOT_FILEPATH)
+
+def restore_state_snapshot(include_world_status: bool = True) -> bool:
+    '''Loads the cached data saved by save_state_snapshot(), returns True if a usable snapshot was found
+
+    Days before today are dropped from the saved events, the rest of the saved range is served until the next refresh.'''
+    global DATA
+    snapshot, saved_at = load_snapshot(SNAPSHOT_FILEPATH)
+    if snapshot is None:
+        logger.info('No usable snapshot at %s, waiting for the first refresh', SNAPSHOT_FILEPATH)
+        return False
+    try:
+        restored_data = DATA.with_siege_times(
+            {c_name: siege_time for c_name, siege_time in snapshot['siege_times'].items() if c_name in CITIES}
+        ).with_events(EventStore.from_dict(snapshot['event_store']).since(server_today()))
+        if include_world_status:
+            world_status_history.load_dict(snapshot.get('world_status_history', {}))
+            for world_name, world_status in snapshot['world_status'].items():
+                if world_name in world_status_poller.watched_worlds:
+                    world_status_poller.world_status[world_name] = world_status
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        logger.error('Ignoring malformed snapshot at %s: %r', SNAPSHOT_FILEPATH, e)
+        if include_world_status:
+            world_status_poller.world_status.clear()
+            world_status_history.load_dict({})
+        return False
+    DATA = restored_data
+    logger.info('Restored snapshot saved at %s with %s events through %s', saved_at.isoformat(), len(DATA.events), DATA.events.end_date)
+    return True
+
+async def reload_shared_snapshot() -> None:
+    '''Reloads siege and event data from the data leader's snapshot if it was rewritten since the last reload
+
+    Guild events are updated too when the reloaded data changes them, the leader only updates its own guilds.'''
+    global SNAPSHOT_MTIME
+    try:
+        snapshot_mtime = os.stat(SNAPSHOT_FILEPATH).st_mtime
+    except OSError as e:
+        logger.warning('Data leader snapshot %s is not available yet: %s', SNAPSHOT_FILEPATH, e)
+        return
+    if snapshot_mtime == SNAPSHOT_MTIME:
+        return
+    previous_guild_events = build_guild_event_payloads()
+    if restore_state_snapshot(include_world_status=False):
+        SNAPSHOT_MTIME = snapshot_mtime
+        await rebuild_response_cache()
+        if build_guild_event_payloads() != previous_guild_events:
+            await update_guild_events()
+
+
+async def resolve_channel(int_channel_id: int):
+    '''Returns the channel for [int_channel_id] from the cache, or from the API if it is not cached
+
+    Returns None if the channel belongs to a shard run by another process. Raises discord.NotFound or
+    discord.Forbidden if the bot cannot see the channel.'''
+    channel = bot.get_channel(int_channel_id)
+    if channel is not None:
+        return channel
+    if int_channel_id in FOREIGN_CHANNEL_IDS:
+        return None
+    logger.debug('Channel %s is not cached, fetching it', int_channel_id)
+    channel = await bot.fetch_channel(int_channel_id)
+    guild = getattr(channel, 'guild', None)
+    if guild is not None and not SHARD_PLAN.owns_guild(guild.id):
+        logger.debug('Channel %s is not on %s, leaving it to another process', int_channel_id, SHARD_PLAN.describe())
+        FOREIGN_CHANNEL_IDS.add(int_channel_id)
+        return None
+    return channel
+
+async def send_to_channels(channel_ids: list, content: str, allowed_mentions: discord.AllowedMentions = None, kind: str = 'message', semaphore: asyncio.Semaphore = None) -> dict:
+    '''Sends [content] to every channel in [channel_ids] at most MAX_CONCURRENT_SENDS at a time
 
-async def send_world_status_if_changed(channel_id_list: list, status_client: NWWorldStatusClient, world_name: str):
-    '''Sends a message if the world status changes to [channel]. See channel_events.json'''
-    logger.debug(f'Checking if {world_name} status has changed')
-    old_world_status = status_client.world_status
-    if status_client.has_world_status_changed():
+    Concurrent calls that pass the same [semaphore] share that limit. Returns {channel_id: result} where result
+    is sent, other_shard, not_found, forbidden or failed.'''
+    semaphore = semaphore or asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+    sends = REGISTRY.counter('channel_sends_total', 'Messages sent to channels by kind and result')
+
+    async def send_one(target_channel_id):
+        async with semaphore:
+            try:
+                channel = await resolve_channel(int(target_channel_id))
+                if channel is None:
+                    return 'other_shard'
+                await channel.send(content, allowed_mentions=allowed_mentions)
+            except discord.NotFound:
+                logger.error('Failed to send %s to channel %s: channel not found', kind, target_channel_id)
+                return 'not_found'
+            except discord.Forbidden:
+                logger.error('Failed to send %s to channel %s: missing permissions', kind, target_channel_id)
+                return 'forbidden'
+            except discord.HTTPException as e:
+                logger.error('Failed to send %s to channel %s: %s', kind, target_channel_id, e)
+                return 'failed'
+            return 'sent'
+
+    results = await asyncio.gather(*(send_one(target_channel_id) for target_channel_id in channel_ids))
+    for result in results:
+        sends.inc(kind=kind, result=result)
+    return dict(zip(channel_ids, results))
+
+def build_announcement_message(city: str) -> str:
+    '''Returns the sign-up reminder for [city]'s event today, or None if [city] has no event today'''
+    data = DATA
+    event = data.events.get(server_today(), city)
+    if event is None:
+        return None
+    return f"@everyone don't forget to sign up for the {event.event_type} today in {city} at {describe_siege_time(data, city)}. " + \
+        'Remember to sign up early to help ensure you get a spot!'
+
+async def send_slot_announcements(hour: int, minute: int) -> dict:
+    '''Sends the announcement for every channel scheduled at [hour]:[minute] whose city has an event today. See channel_events.json
+
+    Each city's message is rendered once and sent to all of its channels concurrently, returns {channel_id: result}.'''
+    logger.debug('Attempting to send_slot_announcements() for %02d:%02d', hour, minute)
+    channels_by_city = {}
+    for announce_channel_id, channel_config in CHANNELS_WITH_ANNOUNCE_ENABLED.items():
+        if (channel_config['hour'], channel_config['minute']) == (hour, minute):
+            channels_by_city.setdefault(channel_config['city'], []).append(announce_channel_id)
+    allowed_mentions = discord.AllowedMentions(everyone=True)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS) # shared by every city, the slot sends MAX_CONCURRENT_SENDS at a time in total
+    results = {}
+    sends = []
+    for city, channel_ids in channels_by_city.items():
+        announcement_message = build_announcement_message(city)
+        if announcement_message is None:
+            logger.debug('Determined %s does not have an invasion today, no announcement needed for %s channels', city, len(channel_ids))
+            results.update(dict.fromkeys(channel_ids, 'no_event'))
+            continue
+        logger.debug('Sending announcement message for %s to %s channels', city, len(channel_ids))
+        sends.append(send_to_channels(channel_ids, announcement_message, allowed_mentions, kind='announcement', semaphore=semaphore))
+    for city_results in await asyncio.gather(*sends):
+        results.update(city_results)
+    counts = {}
+    for result in results.values():
+        counts[result] = counts.get(result, 0) + 1
+    logger.info('Announcements for %02d:%02d: %s', hour, minute, counts)
+    for announce_channel_id, result in results.items():
+        logger.debug('Announcement result for channel %s: %s', announce_channel_id, result)
+    return results
+
+async def refresh_world_statuses() -> None:
+    '''Fetches the world status page once, records every world's status and sends updates for every watched world that changed
+
+    The next poll is scheduled from world_status_schedule: sooner after a change or while a watched world is down, later
+    while nothing changes, and backing off when the page cannot be fetched or parsed.'''
+    logger.debug('Attempting to refresh_world_statuses()')
+    try:
+        await REFRESHES.run('world-status', poll_world_statuses)
+    finally:
+        if SCHEDULER is not None and WORLDS_WITH_STATUS_UPDATE_ENABLED:
+            delay = world_status_schedule.next_delay()
+            logger.debug('Next world status poll in %.0f seconds', delay)
+            schedule_world_status_poll(delay)
+    logger.debug('Completed running refresh_world_statuses()')
+
+async def poll_world_statuses() -> None:
+    '''Runs one world status poll and records its outcome in world_status_schedule'''
+    polls = REGISTRY.counter('world_status_polls_total', 'World status polls by outcome')
+    try:
+        await world_status_poller.refresh()
+    except (aiohttp.ClientError, asyncio.TimeoutError, StatusPageFormatError) as e:
+        polls.inc(outcome='failed')
+        circuit_state = world_status_schedule.record_failure()
+        if world_status_schedule.consecutive_failures == 1:
+            logger.error('Failed to fetch world statuses, backing off: %r', e)
+        elif circuit_state == OPEN:
+            logger.error('Failed to fetch world statuses %s times in a row, pausing polls for %.0f seconds: %r', world_status_schedule.consecutive_failures, world_status_schedule.open_seconds, e)
+        else:
+            logger.debug('Failed to fetch world statuses again: %r', e)
+        return
+    previous_circuit_state = world_status_schedule.record_success(
+        changed=bool(world_status_poller.changed_worlds),
+        unavailable=any(world_status_poller.world_status.get(world_name) in UNAVAILABLE_STATUSES for world_name in WORLDS_WITH_STATUS_UPDATE_ENABLED)
+    )
+    if previous_circuit_state != CLOSED:
+        logger.warning('World status page is reachable again')
+    polls.inc(outcome='changed' if world_status_poller.changed_worlds else 'unchanged')
+    global UNLISTED_WATCHED_WORLDS
+    unlisted_worlds = set(WORLDS_WITH_STATUS_UPDATE_ENABLED) - world_status_poller.world_index.keys()
+    if unlisted_worlds != UNLISTED_WATCHED_WORLDS:
+        if unlisted_worlds:
+            logger.warning('Watched worlds not listed in any region of the status page: %s', sorted(unlisted_worlds))
+        UNLISTED_WATCHED_WORLDS = unlisted_worlds
+    observed_at = time.time()
+    history_changed = False
+    for world_name, world_status in world_status_poller.status_list.items():
+        history_changed = world_status_history.record(world_name, world_status, observed_at) or history_changed
+    for world_name in WORLDS_WITH_STATUS_UPDATE_ENABLED:
+        await send_world_status_if_changed(WORLDS_WITH_STATUS_UPDATE_ENABLED[world_name], world_name)
+    # keep the saved last-seen times fresh too, so a restart can tell how long the bot was away
+    if history_changed or SNAPSHOT_SAVED_AT is None or time.monotonic() - SNAPSHOT_SAVED_AT >= STATUS_SNAPSHOT_INTERVAL:
+        await save_state_snapshot()
+
+async def send_world_status_if_changed(channel_id_list: list, world_name: str):
+    '''Sends a message to every channel in [channel_id_list] if [world_name] changed in the latest poll. See world_updates.json'''
+    logger.debug('Checking if %s status has changed', world_name)
+    if world_name in world_status_poller.changed_worlds:
         logger.debug('Determined world status has changed')
-        new_world_status = status_client.world_status
+        old_world_status, new_world_status = world_status_poller.changed_worlds[world_name]
         update_message = f"{world_name}'s status has changed from {old_world_status} to {new_world_status}"
-        for update_channel_id in channel_id_list:
-            logger.debug(f'Sending world status update to {str(update_channel_id)}')
-            update_channel = bot.get_channel(int(update_channel_id))
-            await update_channel.send(update_message)
+        logger.debug('Sending world status update to %s channels', len(channel_id_list))
+        results = await send_to_channels(channel_id_list, update_message, kind='world_status')
+        logger.debug('World status update results for %s: %s', world_name, results)
     else:
         logger.debug('Determined world status has not changed')
 
-async def update_guild_events():
-    '''Creates events that do not already exist in enabled channels'''
+def build_guild_event_payloads() -> list:
+    '''Returns the scheduled event payload for every event in the next GUILD_EVENT_DAYS days that has not started, shared by all guilds
+
+    Started events are left out, Discord no longer lists them as scheduled so they would be created again.'''
     invasion_event_description = 'Available to players level 50+. Sign up at the town board!'
+    today = server_today()
+    last_date = today + datetime.timedelta(days=GUILD_EVENT_DAYS)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    data = DATA
+    payloads = []
+    for event in data.events.events():
+        if not today <= event.date < last_date or event.city not in data.schedule:
+            continue
+        event_type = event.event_type.capitalize()
+        event_name = f'{event_type} at {event.city}'
+        if event_type == 'War':
+            event_description = f'{event.attacker} is attacking {event.defender}'
+        else:
+            event_description = invasion_event_description
+        logger.debug('Found event: [%s] with description: [%s]', event_name, event_description)
+        start_time = f"{event.date.strftime('%Y-%m-%d')} {data.schedule.label(event.city)}"
+        payload = build_guild_event(event_name, event_description, start_time)
+        if parse_event_time(payload['scheduled_start_time']) > now:
+            payloads.append(payload)
+    return payloads
 
-    for guild_id in GUILDS_WITH_EVENT_CREATION_ENABLED:
-        logger.debug(f'Adding events for enabled guild with ID: {guild_id}')
-        current_guild_event_names = []
-        current_guild_events = await event_client.list_guild_events(str(guild_id))
-        for event in current_guild_events:
-            current_guild_event_names.append(event['name'])
-        for city in TODAYS_CITIES_WITH_EVENTS:
-            event_type = str(UPCOMING_EVENT_INFO[city]['event_type']).capitalize()
-            event_name = f'{event_type} at {city}'
-            if event_type == 'War':
-                event_description = f"{str(UPCOMING_EVENT_INFO[city]['event_attacker'])} is attacking {str(UPCOMING_EVENT_INFO[city]['event_defender'])}"
-            else:
-                event_description = invasion_event_description
-            logger.debug(f'Found event: [{event_name}] with description: [{event_description}]')
-            if event_name not in current_guild_event_names:
-                start_time = f"{str(UPCOMING_EVENT_INFO[city]['event_date'])} {CITY_INFO[city]['siege_time']}"
-                await event_client.create_guild_event(
-                    str(guild_id),
-                    event_name,
-                    event_description,
-                    event_start_est=start_time
-                )
-                time.sleep(2.5) # attempting to prevent rate limiting
-        for city in TOMORROWS_CITIES_WITH_EVENTS:
-            event_type = str(UPCOMING_EVENT_INFO[city]['event_type']).capitalize()
-            event_name = f'{event_type} at {city}'
-            if event_type == 'War':
-                event_description = f"{str(UPCOMING_EVENT_INFO[city]['event_attacker'])} is attacking {str(UPCOMING_EVENT_INFO[city]['event_defender'])}"
-            else:
-                event_description = invasion_event_description
-            logger.debug(f'Found event: [{event_name}] with description: [{event_description}]')
-            if event_name not in current_guild_event_names:
-                start_time = f"{str(UPCOMING_EVENT_INFO[city]['event_date'])} {CITY_INFO[city]['siege_time']}"
-                await event_client.create_guild_event(
-                    str(guild_id),
-                    event_name,
-                    event_description,
-                    event_start_est=start_time
-                )
-                time.sleep(2.5) # attempting to prevent rate limiting
+def is_bot_event_name(event_name: str) -> bool:
+    '''Returns True if [event_name] has the form the bot uses for guild events, e.g. Invasion at Everfall'''
+    event_type, _, city = event_name.partition(' at ')
+    return event_type in ('Invasion', 'War') and city in CITIES
+
+def is_managed_guild_event(event: dict) -> bool:
+    '''Returns True if the bot reconciles [event]: it has a bot event name and its city's siege window is loaded
+
+    Events of a city without a siege window are left alone, build_guild_event_payloads() has none for it to match.'''
+    city = event['name'].partition(' at ')[2]
+    return is_bot_event_name(event['name']) and city in DATA.schedule
+
+async def update_guild_events(guild_ids: list = None):
+    '''Creates, updates and deletes events in [guild_ids] (default all enabled guilds) so they match the next GUILD_EVENT_DAYS days of events'''
+    data = DATA
+    if not data.events.covers(server_today()) or not data.schedule.siege_times():
+        logger.warning('Skipping update_guild_events(), events or siege windows are not loaded yet and every bot event would look stale')
+        return
+    guild_ids = GUILDS_WITH_EVENT_CREATION_ENABLED if guild_ids is None else guild_ids
+    owned_guild_ids = [guild_id for guild_id in guild_ids if SHARD_PLAN.owns_guild(int(guild_id))]
+    logger.debug('Attempting to update_guild_events() for %s of %s guilds', len(owned_guild_ids), len(guild_ids))
+    with REGISTRY.timed('guild_event_update', 'update_guild_events run latency'):
+        desired_events = build_guild_event_payloads()
+        results = await guild_event_reconciler.reconcile(owned_guild_ids, desired_events)
+    guild_event_lists = REGISTRY.counter('guild_event_lists_total', 'Guild scheduled event lists read over REST because no recent list was cached')
+    for guild_id, result in results.items():
+        logger.debug('Reconciled events for guild %s: %s', guild_id, result)
+        if result['listed']:
+            guild_event_lists.inc(result['listed'])
+    logger.debug('Completed running update_guild_events()')
 
-city_slash_choice_list = []
-for city_choice_name in CITY_INFO:
-    city_slash_choice_list.append(
-        create_choice(
-            name=city_choice_name,
-            value=city_choice_name
-        )
-    )
-day_slash_choice_list = [
-    create_choice(
-        name='Today',
-        value='today'
-    ),
-    create_choice(
-        name='Tomorrow',
-        value='tomorrow'
-    )
-]
-@slash.slash(name='events',
-            description='Responds with all events (wars and invasions) happening in the next two days',
-            options=[
-                create_option(
-                    name='city',
-                    description='The city you would like information for',
-                    option_type=3,
-                    required=False,
-                    choices=city_slash_choice_list
-                ),
-                create_option(
-                    name='day',
-                    description='The day you would like information for, default is today and tomorrow',
-                    option_type=3,
-                    required=False,
-                    choices=day_slash_choice_list
-                )
-            ])
 async def events(ctx, city: str = None, day: str = None):
     '''Responds to /events command with all events happening for the city, or for today sorted by time'''
-    logger.info(f'/events [city: {city}] [day: {day}] invoked')
-
-    if city is None:
-        response = await get_all_event_string(day)
-    else:
-        response = await get_city_event_string(city, day)
+    logger.info('/events [city: %s] [day: %s] invoked', city, day)
 
-    await ctx.send(response)
+    with REGISTRY.timed('bot_command', 'Slash command latency', command='events'):
+        response = await get_cached_response(('events', city, day))
+        await ctx.send(response)
 
-@slash.slash(name='windows',
-            description='Responds with all siege windows in the server'
-    )
 async def windows(ctx):
     '''Respods to /windows command with a list of siege windows sorted alphabetically'''
     logger.info('/windows invoked')
-    window_texts = ['The server siege windows are:']
-    cities = []
-    for key in CITY_INFO:
-        cities.append(key)
-    cities.sort()
-    for city in cities:
-        logger.debug(f"Determined siege time for {city} as {CITY_INFO[city]['siege_time']}")
-        window_texts.append(f"{city: <32} {CITY_INFO[city]['siege_time']} EST")
-    response = '\n'.join(t for t in window_texts)
-    await ctx.send(response)
-
-bot.run(config['DISCORD_TOKEN'])
+    with REGISTRY.timed('bot_command', 'Slash command latency', command='windows'):
+        response = await get_cached_response(('windows',))
+        await ctx.send(response)
+
+def is_admin(ctx) -> bool:
+    '''Returns True if the user who invoked [ctx] is listed in ADMIN_USER_IDS'''
+    return int(ctx.author_id) in ADMIN_USER_IDS
+
+async def loglevel(ctx, level: str):
+    '''Responds to /loglevel by changing the log level, for admins only'''
+    if not is_admin(ctx):
+        logger.warning('/loglevel [level: %s] denied for user %s', level, ctx.author_id)
+        await ctx.send('This command is only available to bot admins.', hidden=True)
+        return
+    previous_level = set_log_level(logger, level)
+    logger.warning('/loglevel changed log level from %s to %s for user %s', previous_level, level, ctx.author_id)
+    await ctx.send(f'Log level changed from {previous_level} to {level}', hidden=True)
+
+async def metrics(ctx):
+    '''Responds to /metrics with a latency summary of every instrumented path, for admins only'''
+    if not is_admin(ctx):
+        logger.warning('/metrics denied for user %s', ctx.author_id)
+        await ctx.send('This command is only available to bot admins.', hidden=True)
+        return
+    await ctx.send(f'```\n{REGISTRY.summary()[:1900]}\n```', hidden=True)
+
+async def memory(ctx):
+    '''Responds to /memory with RSS and the top tracemalloc allocators, also written to MEMORY_REPORT_FILEPATH, for admins only'''
+    if not is_admin(ctx):
+        logger.warning('/memory denied for user %s', ctx.author_id)
+        await ctx.send('This command is only available to bot admins.', hidden=True)
+        return
+    report = await asyncio.get_event_loop().run_in_executor(None, write_memory_report, MEMORY_REPORT_FILEPATH)
+    logger.info('/memory wrote memory report to %s for user %s', MEMORY_REPORT_FILEPATH, ctx.author_id)
+    await ctx.send(f'```\n{report[:1900]}\n```', hidden=True)
+
+async def profile(ctx, seconds: int = 10):
+    '''Responds to /profile by sampling the event loop thread for [seconds] and listing the hottest call paths, for admins only'''
+    if not is_admin(ctx):
+        logger.warning('/profile denied for user %s', ctx.author_id)
+        await ctx.send('This command is only available to bot admins.', hidden=True)
+        return
+    seconds = min(PROFILE_MAX_SECONDS, max(1, seconds))
+    await ctx.defer(hidden=True)
+    report = await profile_loop_thread(threading.get_ident(), seconds)
+    logger.info('/profile sampled the event loop for %s seconds for user %s:\n%s', seconds, ctx.author_id, report)
+    await ctx.send(f'```\n{report[:1900]}\n```', hidden=True)
+
+async def refresh(ctx, city: str = None):
+    '''Responds to /refresh by reloading the siege window and events of [city], or all data if [city=None], for admins only'''
+    if not is_admin(ctx):
+        logger.warning('/refresh [city: %s] denied for user %s', city, ctx.author_id)
+        await ctx.send('This command is only available to bot admins.', hidden=True)
+        return
+    logger.warning('/refresh [city: %s] invoked by user %s', city, ctx.author_id)
+    await ctx.defer(hidden=True)
+    start = time.perf_counter()
+    try:
+        if not SHARD_PLAN.is_data_leader: # only the data leader reads dynamodb
+            await reload_shared_snapshot()
+            reloaded = "the data leader's snapshot"
+        elif city:
+            await refresh_siege_window(city)
+            await refresh_city_events(city)
+            reloaded = f'the siege window and events for {city}'
+        else:
+            await refresh_siege_window()
+            await refresh_event_data()
+            reloaded = 'all siege windows and events'
+            if WORLDS_WITH_STATUS_UPDATE_ENABLED:
+                await refresh_world_statuses()
+                reloaded += ' and world statuses'
+        await REFRESHES.run('guild-events', update_guild_events)
+    except Exception as e:
+        logger.exception('/refresh [city: %s] failed: %s', city, e)
+        await ctx.send(f'Refresh failed, see the log: {e!r}'[:1990], hidden=True)
+        return
+    await ctx.send(f'Reloaded {reloaded} in {time.perf_counter() - start:.1f}s', hidden=True)
+
+def describe_world_status(world_name: str) -> str:
+    '''Returns a line with [world_name]'s current status, how long it has had it and its recent uptime'''
+    current = world_status_history.current(world_name)
+    region = world_status_poller.region_of(world_name)
+    world_label = world_name if region is None else f'{world_name} ({region})'
+    if current is None:
+        return f'{world_label}: no recent status recorded'
+    world_status, changed_at, last_seen = current
+    now = time.time()
+    uptime_texts = []
+    for label, window_seconds in (('24h', 86400), ('7d', 604800)):
+        uptime = world_status_history.uptime(world_name, window_seconds, now)
+        if uptime is None:
+            break
+        available_fraction, observed_seconds = uptime
+        if observed_seconds < window_seconds * 0.99: # history does not cover the whole window
+            uptime_texts.append(f'{available_fraction:.1%} over the {format_duration(datetime.timedelta(seconds=observed_seconds))} tracked')
+            break
+        uptime_texts.append(f'{available_fraction:.1%} over {label}')
+    return (
+        f'{world_label} is **{world_status}** for {format_duration(datetime.timedelta(seconds=now - changed_at))}'
+        f" (checked {format_duration(datetime.timedelta(seconds=now - last_seen))} ago), uptime {', '.join(uptime_texts) or 'not known yet'}"
+    )
+
+async def status(ctx, world: str = None):
+    '''Responds to /status with the current status, time since the last change and uptime of [world] or every watched world'''
+    logger.info('/status [world: %s] invoked', world)
+    with REGISTRY.timed('bot_command', 'Slash command latency', command='status'):
+        if world is None:
+            world_names = sorted(WORLDS_WITH_STATUS_UPDATE_ENABLED)
+            if not world_names:
+                await ctx.send('No worlds are watched, try /status with a world name.')
+                return
+        else:
+            world_names = [known_world for known_world in world_status_history.worlds() if known_world.lower() == world.strip().lower()]
+            if not world_names:
+                await ctx.send(f'No status has been recorded for {world} yet.')
+                return
+        await ctx.send('\n'.join(describe_world_status(world_name) for world_name in world_names)[:1990])
+
+def register_slash_commands() -> SlashCommand:
+    '''Builds the command choices and registers every slash command, called once before the bot connects'''
+    slash = SlashCommand(bot, sync_commands=True)
+    city_slash_choice_list = [create_choice(name=city_choice_name, value=city_choice_name) for city_choice_name in CITIES]
+    day_slash_choice_list = [
+        create_choice(
+            name='Today',
+            value='today'
+        ),
+        create_choice(
+            name='Tomorrow',
+            value='tomorrow'
+        )
+    ] + [create_choice(name=f'In {day_offset} days', value=day_offset) for day_offset in EVENT_DAY_OPTIONS[2:]]
+    slash.add_slash_command(
+        events,
+        name='events',
+        description='Responds with all events (wars and invasions) happening today and tomorrow, or on a later day',
+        options=[
+            create_option(
+                name='city',
+                description='The city you would like information for',
+                option_type=3,
+                required=False,
+                choices=city_slash_choice_list
+            ),
+            create_option(
+                name='day',
+                description='The day you would like information for, default is today and tomorrow',
+                option_type=3,
+                required=False,
+                choices=day_slash_choice_list
+            )
+        ]
+    )
+    slash.add_slash_command(
+        windows,
+        name='windows',
+        description='Responds with all siege windows in the server'
+    )
+    slash.add_slash_command(
+        status,
+        name='status',
+        description='Responds with world status, time since it last changed and recent uptime',
+        options=[
+            create_option(
+                name='world',
+                description='The world you would like the status of, default is every watched world',
+                option_type=3,
+                required=False
+            )
+        ]
+    )
+    log_level_slash_choice_list = [create_choice(name=level.capitalize(), value=level) for level in LOG_LEVELS]
+    slash.add_slash_command(
+        loglevel,
+        name='loglevel',
+        description='Admin only: changes the bot log level without a restart',
+        options=[
+            create_option(
+                name='level',
+                description='The new log level',
+                option_type=3,
+                required=True,
+                choices=log_level_slash_choice_list
+            )
+        ]
+    )
+    slash.add_slash_command(
+        metrics,
+        name='metrics',
+        description='Admin only: shows request counts, errors and p50/p99 latency'
+    )
+    slash.add_slash_command(
+        memory,
+        name='memory',
+        description='Admin only: shows memory use and the top allocators'
+    )
+    slash.add_slash_command(
+        refresh,
+        name='refresh',
+        description='Admin only: reloads siege windows and events now, for one city or all data',
+        options=[
+            create_option(
+                name='city',
+                description='The city to reload, default is all data',
+                option_type=3,
+                required=False,
+                choices=city_slash_choice_list
+            )
+        ]
+    )
+    slash.add_slash_command(
+        profile,
+        name='profile',
+        description='Admin only: samples the event loop and shows the hottest call paths',
+        options=[
+            create_option(
+                name='seconds',
+                description=f'How long to sample, 1 to {PROFILE_MAX_SECONDS} seconds (default 10)',
+                option_type=4,
+                required=False
+            )
+        ]
+    )
+    return slash
+
+if __name__ == '__main__':
+    if LOW_MEMORY_MODE: # the default executor would otherwise grow to cpu count + 4 threads
+        bot.loop.set_default_executor(ThreadPoolExecutor(max_workers=2, thread_name_prefix='worker'))
+    restore_state_snapshot()
+    register_slash_commands()
+    if LOOP_LAG_THRESHOLD_SECONDS:
+        loop_watchdog.start(bot.loop)
+    bot.run(config['DISCORD_TOKEN'])
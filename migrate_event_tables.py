@@ -0,0 +1,146 @@
+# migrate_event_tables.py
+'''Copies the per-city event tables into the single table read when EVENT_TABLE_NAME is set
+
+Run from the bot directory, settings default to .env, .env.secret and the environment:
+    python migrate_event_tables.py --table invasion-events [--create-table] [--dry-run]'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+from dotenv import dotenv_values
+
+from utils.dynamodb_loader import DynamoDBLoader
+from utils.event_source import CITIES, DEFAULT_CITY_INDEX_NAME, SingleTableEventSource, city_table_name
+
+BATCH_WRITE_ITEM_LIMIT = 25 # max items per BatchWriteItem request
+MAX_UNPROCESSED_RETRIES = 5
+VERIFY_ATTEMPTS = 5 # the city index is eventually consistent, so counts may lag the writes briefly
+
+def create_event_table(client, table_name: str, city_index_name: str) -> None:
+    '''Creates [table_name] keyed by date and city with a [city_index_name] index keyed by city and date, if it does not exist'''
+    try:
+        client.create_table(
+            TableName=table_name,
+            AttributeDefinitions=[
+                {'AttributeName': 'date', 'AttributeType': 'S'},
+                {'AttributeName': 'city', 'AttributeType': 'S'}
+            ],
+            KeySchema=[
+                {'AttributeName': 'date', 'KeyType': 'HASH'},
+                {'AttributeName': 'city', 'KeyType': 'RANGE'}
+            ],
+            GlobalSecondaryIndexes=[{
+                'IndexName': city_index_name,
+                'KeySchema': [
+                    {'AttributeName': 'city', 'KeyType': 'HASH'},
+                    {'AttributeName': 'date', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }],
+            BillingMode='PAY_PER_REQUEST'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ResourceInUseException':
+            raise
+        print(f'Table {table_name} already exists')
+        return
+    print(f'Creating table {table_name}...')
+    client.get_waiter('table_exists').wait(TableName=table_name)
+
+def scan_table(client, table_name: str) -> list:
+    '''Returns every item in [table_name]'''
+    items = []
+    for page in client.get_paginator('scan').paginate(TableName=table_name, ConsistentRead=True):
+        items.extend(page['Items'])
+    return items
+
+def write_items(client, table_name: str, items: list) -> None:
+    '''Puts [items] into [table_name] with BatchWriteItem, retrying unprocessed items with exponential backoff'''
+    for chunk_start in range(0, len(items), BATCH_WRITE_ITEM_LIMIT):
+        pending = {table_name: [{'PutRequest': {'Item': item}} for item in items[chunk_start:chunk_start + BATCH_WRITE_ITEM_LIMIT]]}
+        for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+            pending = client.batch_write_item(RequestItems=pending).get('UnprocessedItems')
+            if not pending:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+        else:
+            raise RuntimeError(f'BatchWriteItem left items unprocessed after {MAX_UNPROCESSED_RETRIES} retries')
+
+def migrate(client, table_prefix: str, table_name: str, dry_run: bool = False) -> dict:
+    '''Copies every per-city table into [table_name] with a city attribute added, returns {city: [dates copied]}'''
+    copied = {}
+    for city in CITIES:
+        source_table = city_table_name(table_prefix, city)
+        try:
+            items = scan_table(client, source_table)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            print(f'{city}: {source_table} does not exist, skipping')
+            continue
+        print(f"{city}: {'would copy' if dry_run else 'copying'} {len(items)} items from {source_table}")
+        if not dry_run:
+            write_items(client, table_name, [dict(item, city={'S': city}) for item in items])
+        copied[city] = sorted(item['date']['S'] for item in items)
+    return copied
+
+async def verify(client, table_name: str, city_index_name: str, copied: dict) -> bool:
+    '''Reads each city back through the city index and returns True if every copied date is there'''
+    source = SingleTableEventSource(DynamoDBLoader(client), table_name, CITIES, city_index_name)
+    complete = True
+    for city, dates in copied.items():
+        if not dates:
+            continue
+        start_date = datetime.datetime.strptime(dates[0], '%Y-%m-%d').date()
+        days = (datetime.datetime.strptime(dates[-1], '%Y-%m-%d').date() - start_date).days + 1
+        for attempt in range(VERIFY_ATTEMPTS):
+            found_dates = sorted(event.date.strftime('%Y-%m-%d') for event in await source.load_city(city, start_date, days))
+            if found_dates == dates:
+                break
+            await asyncio.sleep(2 ** attempt)
+        else:
+            print(f'{city}: expected {len(dates)} events in {city_index_name}, found {len(found_dates)}')
+            complete = False
+    return complete
+
+def main() -> None:
+    '''Parses arguments, then creates, copies and verifies'''
+    config = {
+        **dotenv_values('.env'),
+        **dotenv_values('.env.secret'),
+        **os.environ
+    }
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n', maxsplit=1)[0])
+    arg_parser.add_argument('--table', default=config.get('EVENT_TABLE_NAME'), help='single event table to copy into (default EVENT_TABLE_NAME)')
+    arg_parser.add_argument('--table-prefix', default=config.get('EVENT_TABLE_PREFIX'), help='per-city table prefix to copy from (default EVENT_TABLE_PREFIX)')
+    arg_parser.add_argument('--city-index', default=config.get('EVENT_CITY_INDEX_NAME') or DEFAULT_CITY_INDEX_NAME, help='name of the city index')
+    arg_parser.add_argument('--region', default=config.get('AWS_REGION'), help='AWS region (default AWS_REGION)')
+    arg_parser.add_argument('--profile', default=config.get('DEV_AWS_PROFILE'), help='AWS profile (default DEV_AWS_PROFILE)')
+    arg_parser.add_argument('--create-table', action='store_true', help='create the single table and its city index first')
+    arg_parser.add_argument('--dry-run', action='store_true', help='only report what would be copied')
+    args = arg_parser.parse_args()
+    if not args.table or not args.table_prefix:
+        sys.exit('--table and --table-prefix are required when EVENT_TABLE_NAME and EVENT_TABLE_PREFIX are not set')
+
+    client = boto3.Session(profile_name=args.profile, region_name=args.region).client('dynamodb')
+    if args.create_table and not args.dry_run:
+        create_event_table(client, args.table, args.city_index)
+    copied = migrate(client, args.table_prefix, args.table, dry_run=args.dry_run)
+    print(f'{sum(len(dates) for dates in copied.values())} items from {len(copied)} tables')
+    if args.dry_run:
+        return
+    if not asyncio.get_event_loop().run_until_complete(verify(client, args.table, args.city_index, copied)):
+        sys.exit('Verification failed, some events are missing from the city index')
+    print(f'Verified every city through {args.city_index}, set EVENT_TABLE_NAME={args.table} to switch the bot over')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+# bot_data.py
+'''Siege windows and events published together as one immutable value'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+from typing import NamedTuple
+
+from utils.event_store import EventStore
+from utils.siege_schedule import SiegeSchedule
+
+class BotData(NamedTuple):
+    '''Everything commands, announcements and guild events read, replaced as a whole and never modified
+
+    Writers build the next BotData from the current one and publish it with a single assignment, so a reader
+    that takes one reference sees either the old data or the new data and never a mix.'''
+    schedule: SiegeSchedule
+    events: EventStore
+
+    def with_siege_times(self, siege_times: dict):
+        '''Returns a copy with [siege_times] merged into the siege windows and the events re-sorted by them'''
+        schedule = SiegeSchedule(dict(self.schedule.siege_times(), **siege_times), self.schedule.timezone)
+        return BotData(schedule, self.events.with_schedule(schedule))
+
+    def with_events(self, events: EventStore):
+        '''Returns a copy with [events] sorted by the current siege windows'''
+        return BotData(self.schedule, events.with_schedule(self.schedule))
+
+    @classmethod
+    def empty(cls, start_date):
+        '''Returns data with no siege windows and no events loaded from [start_date]'''
+        schedule = SiegeSchedule({})
+        return cls(schedule, EventStore([], start_date, 0, schedule))
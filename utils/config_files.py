@@ -0,0 +1,112 @@
+# config_files.py
+'''Parses and validates the JSON config files and notices when they change on disk'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import json
+import logging
+import os
+
+class ConfigFileError(ValueError):
+    '''Raised when a config file is not valid JSON or does not have the expected shape'''
+
+def _check_snowflake(value, description: str) -> None:
+    '''Raises ConfigFileError unless [value] looks like a Discord ID'''
+    if not str(value).isdigit() or not 17 <= len(str(value)) <= 20:
+        raise ConfigFileError(f'{description} {value!r} is not a Discord ID')
+
+def parse_channel_events(events_config: dict, cities) -> dict:
+    '''Returns {channel_id: {'city', 'hour', 'minute'}} for the announcement entries in channel_events.json'''
+    if not isinstance(events_config, dict):
+        raise ConfigFileError('channel_events.json must be an object keyed by channel ID')
+    channels_with_announce_enabled = {}
+    for channel_id, channel_config in events_config.items():
+        _check_snowflake(channel_id, 'Channel')
+        try:
+            event_hour = int(channel_config['event_hour'])
+            event_minute = int(channel_config['event_minute'])
+            event_type = channel_config['event_type']
+        except (KeyError, TypeError, ValueError) as e:
+            raise ConfigFileError(f'Channel {channel_id} needs an event_type and a numeric event_hour and event_minute: {e!r}') from e
+        if not 0 <= event_hour <= 23 or not 0 <= event_minute <= 59:
+            raise ConfigFileError(f'Channel {channel_id} has an invalid time {event_hour}:{event_minute}')
+        if event_type == 'announcement':
+            if channel_config.get('announcement_city') not in cities:
+                raise ConfigFileError(f"Channel {channel_id} has an unknown announcement_city {channel_config.get('announcement_city')!r}")
+            channels_with_announce_enabled[channel_id] = {
+                'city': channel_config['announcement_city'],
+                'hour': event_hour,
+                'minute': event_minute
+            }
+    return channels_with_announce_enabled
+
+def parse_guild_events(guild_events_config: dict) -> list:
+    '''Returns the guild IDs with event creation enabled from guild_events.json'''
+    try:
+        guild_ids = guild_events_config['guilds_with_event_creation_enabled']
+    except (KeyError, TypeError) as e:
+        raise ConfigFileError('guild_events.json needs a guilds_with_event_creation_enabled list') from e
+    if not isinstance(guild_ids, list):
+        raise ConfigFileError('guilds_with_event_creation_enabled must be a list')
+    for guild_id in guild_ids:
+        _check_snowflake(guild_id, 'Guild')
+    return guild_ids
+
+def parse_world_updates(world_updates_config: dict) -> dict:
+    '''Returns {world_name: [channel_id, ...]} from world_updates.json'''
+    if not isinstance(world_updates_config, dict):
+        raise ConfigFileError('world_updates.json must be an object keyed by world name')
+    for world_name, channel_ids in world_updates_config.items():
+        if not isinstance(channel_ids, list):
+            raise ConfigFileError(f'World {world_name} must map to a list of channel IDs')
+        for channel_id in channel_ids:
+            _check_snowflake(channel_id, f'World {world_name} channel')
+    return world_updates_config
+
+class ConfigFileWatcher:
+    '''Loads config files through their parsers and reloads the ones whose modification time changed'''
+    def __init__(self, logger: logging.Logger = None) -> None:
+        self.__files = {} # name -> [path, parser, (mtime, size) last read]
+        self.__logger = logger or logging.getLogger(__name__)
+
+    @staticmethod
+    def __stat(path: str) -> tuple:
+        stat_result = os.stat(path)
+        return stat_result.st_mtime_ns, stat_result.st_size
+
+    @staticmethod
+    def __load(path: str, parser):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return parser(json.load(f))
+        except ValueError as e: # includes JSONDecodeError and ConfigFileError
+            raise ConfigFileError(f'{path}: {e}') from e
+
+    def watch(self, name: str, path: str, parser):
+        '''Starts watching [path] as [name] and returns its parsed contents, raises ConfigFileError or OSError'''
+        file_stat = self.__stat(path)
+        value = self.__load(path, parser)
+        self.__files[name] = [path, parser, file_stat]
+        return value
+
+    def changed(self) -> dict:
+        '''Returns {name: parsed contents} for every watched file that changed and is valid
+
+        A file that fails validation is logged and skipped until it changes again, the caller keeps the old config.'''
+        changes = {}
+        for name, watched_file in self.__files.items():
+            path, parser, last_stat = watched_file
+            try:
+                file_stat = self.__stat(path)
+            except OSError as e:
+                self.__logger.error('Cannot read config file %s: %s', path, e)
+                continue
+            if file_stat == last_stat:
+                continue
+            watched_file[2] = file_stat
+            try:
+                changes[name] = self.__load(path, parser)
+            except (ConfigFileError, OSError) as e:
+                self.__logger.error('Ignoring invalid config change, keeping the previous config: %s', e)
+        return changes
@@ -2,30 +2,177 @@
 '''Discord commands that are not offered in the standard Discord bot library. WIP.'''
 # Disable:
 #   C0301: line length (unavoidable)
-# pylint: disable=C0301
+#   R0913: too many arguments (DiscordAPIError details are keyword-only)
+#   R0914: too many local variables (request() keeps its retry state in locals)
+# pylint: disable=C0301,R0913,R0914
 
+import asyncio
 import datetime
 import json
 from dateutil import tz
 
 import aiohttp
 
+from utils.siege_schedule import SERVER_TIMEZONE
+
+MAX_REQUEST_ATTEMPTS = 5
+
+class DiscordAPIError(Exception):
+    '''Raised when the Discord API answers a request with an error'''
+    def __init__(self, method: str, route: str, status: int, *, code: int = None, message: str = None, errors: dict = None) -> None:
+        self.method = method
+        self.route = route
+        self.status = status
+        self.code = code # Discord JSON error code, see the Discord API docs
+        self.message = message
+        self.errors = errors or {}
+        if status is None: # no response, e.g. connection errors and timeouts
+            super().__init__(f'{method} {route} failed without a response: {message}')
+        else:
+            super().__init__(f'{method} {route} failed with HTTP {status}: {message} (code: {code})')
+
+def build_guild_event(event_name: str, event_description: str, event_start_est: str) -> dict:
+    '''Returns a scheduled event payload for a 30 minute event starting at [event_start_est] (style: 2022-01-01 08:30 PM)'''
+    event_start_obj = datetime.datetime.strptime(f'{event_start_est}', '%Y-%m-%d %I:%M %p').replace(tzinfo=SERVER_TIMEZONE)
+    event_start_time = datetime.datetime.strftime(
+        event_start_obj.astimezone(tz.UTC),
+        '%Y-%m-%dT%H:%M:%S'
+    )
+    event_end_time = datetime.datetime.strftime(
+        event_start_obj.astimezone(tz.UTC) + datetime.timedelta(minutes=30),
+        '%Y-%m-%dT%H:%M:%S'
+    )
+    return {
+        'name': event_name,
+        'privacy_level': 2,
+        'scheduled_start_time': event_start_time,
+        'scheduled_end_time': event_end_time,
+        'description': event_description,
+        'channel_id': None,
+        'entity_metadata': {'location': 'Aeternum'},
+        'entity_type': 3
+    }
+
+class _RateLimitBucket:
+    '''Tracks how many requests a Discord rate limit bucket has left and when it resets'''
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock() # requests in the same bucket are sent one at a time
+        self.remaining = None
+        self.reset_at = 0.0 # event loop time at which [remaining] resets
+
+    async def wait(self) -> None:
+        '''Sleeps until the bucket allows another request'''
+        loop = asyncio.get_event_loop()
+        if self.remaining == 0 and self.reset_at > loop.time():
+            await asyncio.sleep(self.reset_at - loop.time())
+
+    def update(self, headers) -> None:
+        '''Updates the bucket from a response's X-RateLimit-* headers'''
+        if 'X-RateLimit-Remaining' in headers:
+            self.remaining = int(headers['X-RateLimit-Remaining'])
+        if 'X-RateLimit-Reset-After' in headers:
+            self.reset_at = asyncio.get_event_loop().time() + float(headers['X-RateLimit-Reset-After'])
+
 class DiscordCommands:
     '''Class that handles API communication for events tasks'''
-    def __init__(self, token: str) -> None:
-        self.__base_url = 'https://discord.com/api/v8'
+    def __init__(self, token: str, base_url: str = 'https://discord.com/api/v8') -> None:
+        self.__base_url = base_url
         self.__auth_headers = {
             'Authorization': f'Bot {token}',
             'User-Agent':'DiscordBot (https://github.com/adamsbytes/nw-discord-bot) Python/3.7 aiohttp/3.8.1',
             'Content-Type':'application/json'
         }
+        self.__session = None
+        self.__route_bucket_hashes = {} # route key -> X-RateLimit-Bucket hash
+        self.__buckets = {} # bucket key -> _RateLimitBucket
+        self.__global_reset_at = 0.0
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        '''Returns the client's pooled session, creating it on first use'''
+        if self.__session is None or self.__session.closed:
+            self.__session = aiohttp.ClientSession(
+                headers=self.__auth_headers,
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self.__session
+
+    def __get_bucket(self, route_key: str, major_parameter: str) -> _RateLimitBucket:
+        '''Returns the rate limit bucket for a route, shared with every route Discord puts in the same bucket'''
+        bucket_hash = self.__route_bucket_hashes.get(route_key, route_key)
+        return self.__buckets.setdefault(f'{bucket_hash}:{major_parameter}', _RateLimitBucket())
+
+    async def close(self) -> None:
+        '''Closes the pooled HTTP session'''
+        if self.__session is not None:
+            await self.__session.close()
 
-    async def list_guild_events(self, guild_id: str) -> None:
+    async def request(self, method: str, route: str, major_parameter: str = '', data: dict = None, **route_parameters):
+        '''Sends [method] [route] once its rate limit bucket allows, retrying 429s, 5xx responses and connection errors
+
+        [route] is a template like /guilds/{guild_id}/scheduled-events filled from [route_parameters].
+        Returns the decoded JSON body (None for 204 responses) or raises DiscordAPIError.'''
+        route_key = f'{method} {route}'
+        url = self.__base_url + route.format(**route_parameters)
+        body = json.dumps(data) if data is not None else None
+        loop = asyncio.get_event_loop()
+        bucket = self.__get_bucket(route_key, major_parameter) # kept for every retry, a 429 may be the response that reveals the bucket hash
+        for attempt in range(MAX_REQUEST_ATTEMPTS):
+            async with bucket.lock:
+                await bucket.wait()
+                if self.__global_reset_at > loop.time():
+                    await asyncio.sleep(self.__global_reset_at - loop.time())
+                transport_error = None
+                try:
+                    status, headers, raw_body = await self.__send(route_key, major_parameter, bucket, method, url, body)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e: # no response, retried like a 5xx
+                    transport_error = e
+            if transport_error is not None:
+                if attempt == MAX_REQUEST_ATTEMPTS - 1:
+                    raise DiscordAPIError(method, route, None, message=f'gave up after {MAX_REQUEST_ATTEMPTS} attempts, last error: {transport_error!r}')
+                await asyncio.sleep(2 ** attempt)
+                continue
+            try:
+                payload = json.loads(raw_body) if raw_body else None
+            except ValueError: # e.g. an HTML error page from a proxy
+                payload = None
+            if status < 300:
+                return payload
+            if status == 429:
+                retry_after = float(headers.get('Retry-After') or (payload or {}).get('retry_after', 1))
+                if headers.get('X-RateLimit-Global') or (payload or {}).get('global'):
+                    self.__global_reset_at = loop.time() + retry_after
+                else:
+                    bucket.remaining = 0
+                    bucket.reset_at = loop.time() + retry_after
+                continue
+            if status >= 500 and attempt < MAX_REQUEST_ATTEMPTS - 1:
+                await asyncio.sleep(2 ** attempt)
+                continue
+            payload = payload if isinstance(payload, dict) else {}
+            raise DiscordAPIError(method, route, status, code=payload.get('code'), message=payload.get('message'), errors=payload.get('errors'))
+        raise DiscordAPIError(method, route, status, message=f'gave up after {MAX_REQUEST_ATTEMPTS} attempts')
+
+    async def __send(self, route_key: str, major_parameter: str, bucket: _RateLimitBucket, method: str, url: str, body: str) -> tuple:
+        '''Sends one request on the pooled session and records its rate limit headers
+
+        When a route's bucket hash is first seen, [bucket] becomes the hash's bucket unless another route
+        already has one, so the state learned so far carries over to later requests.'''
+        async with self.__get_session().request(method, url, data=body) as response:
+            bucket_hash = response.headers.get('X-RateLimit-Bucket')
+            if bucket_hash is not None and self.__route_bucket_hashes.get(route_key) != bucket_hash:
+                self.__route_bucket_hashes[route_key] = bucket_hash
+                self.__buckets.setdefault(f'{bucket_hash}:{major_parameter}', bucket)
+            bucket.update(response.headers)
+            return response.status, response.headers, await response.read()
+
+    async def list_guild_events(self, guild_id: str) -> list:
         '''Returns a list of guild events'''
-        event_retrieve_url = f'{self.__base_url}/guilds/{guild_id}/scheduled-events'
-        async with aiohttp.ClientSession(headers=self.__auth_headers) as session:
-            async with session.get(event_retrieve_url) as response:
-                return json.loads(await response.read())
+        return await self.request(
+            'GET',
+            '/guilds/{guild_id}/scheduled-events',
+            major_parameter=guild_id,
+            guild_id=guild_id
+        )
 
     async def create_guild_event(
         self,
@@ -33,30 +180,37 @@ class DiscordCommands:
         event_name: str,
         event_description: str,
         event_start_est: str
-    ) -> None:
-        '''Creates a guild event using supplied arguments'''
-        event_create_url = f'{self.__base_url}/guilds/{guild_id}/scheduled-events'
-        event_start_obj = datetime.datetime.strptime(f'{event_start_est}', '%Y-%m-%d %I:%M %p')
-        event_start_time = datetime.datetime.strftime(
-            event_start_obj.astimezone(tz.UTC),
-            '%Y-%m-%dT%H:%M:%S'
+    ) -> dict:
+        '''Creates a guild event using supplied arguments and returns the created event'''
+        return await self.post_guild_event(guild_id, build_guild_event(event_name, event_description, event_start_est))
+
+    async def post_guild_event(self, guild_id: str, event_data: dict) -> dict:
+        '''Creates a guild event from a payload built by build_guild_event() and returns the created event'''
+        return await self.request(
+            'POST',
+            '/guilds/{guild_id}/scheduled-events',
+            major_parameter=guild_id,
+            data=event_data,
+            guild_id=guild_id
+        )
+
+    async def modify_guild_event(self, guild_id: str, event_id: str, event_changes: dict) -> dict:
+        '''Applies [event_changes] to an existing guild event and returns the updated event'''
+        return await self.request(
+            'PATCH',
+            '/guilds/{guild_id}/scheduled-events/{event_id}',
+            major_parameter=guild_id,
+            data=event_changes,
+            guild_id=guild_id,
+            event_id=event_id
         )
-        event_end_time = datetime.datetime.strftime(
-            event_start_obj.astimezone(tz.UTC) + datetime.timedelta(minutes=30),
-            '%Y-%m-%dT%H:%M:%S'
+
+    async def delete_guild_event(self, guild_id: str, event_id: str) -> None:
+        '''Deletes a guild event'''
+        await self.request(
+            'DELETE',
+            '/guilds/{guild_id}/scheduled-events/{event_id}',
+            major_parameter=guild_id,
+            guild_id=guild_id,
+            event_id=event_id
         )
-        event_data = json.dumps({
-            'name': event_name,
-            'privacy_level': 2,
-            'scheduled_start_time': event_start_time,
-            'scheduled_end_time': event_end_time,
-            'description': event_description,
-            'channel_id': None,
-            'entity_metadata': {'location': 'Aeternum'},
-            'entity_type': 3
-        })
-        async with aiohttp.ClientSession(headers=self.__auth_headers) as session:
-            async with session.post(event_create_url, data=event_data) as response:
-                out = await response.read()
-                print(out)
-            await session.close()
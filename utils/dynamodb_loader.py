@@ -0,0 +1,109 @@
+# dynamodb_loader.py
+'''Batched DynamoDB reads that run off the asyncio event loop'''
+# Disable:
+#   C0301: line length (unavoidable)
+#   R0913: too many arguments (query mirrors the boto3 Query parameters)
+# pylint: disable=C0301,R0913
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from utils.metrics import REGISTRY
+
+BATCH_GET_ITEM_LIMIT = 100 # max keys per BatchGetItem request
+MAX_UNPROCESSED_RETRIES = 5
+
+class DynamoDBLoader:
+    '''Wraps a boto3 dynamodb client so reads are batched and never block the event loop'''
+    def __init__(self, client, logger: logging.Logger = None, max_workers: int = 10) -> None:
+        self.__client = client
+        self.__logger = logger or logging.getLogger(__name__)
+        # boto3 clients are thread safe, botocore pools 10 connections by default
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dynamodb')
+
+    async def __call(self, method: str, **kwargs):
+        '''Runs client.[method](**kwargs) in the loader's thread pool'''
+        loop = asyncio.get_event_loop()
+        with REGISTRY.timed('dynamodb_request', 'DynamoDB request latency by operation', operation=method):
+            return await loop.run_in_executor(
+                self.__executor,
+                functools.partial(getattr(self.__client, method), **kwargs)
+            )
+
+    async def get_item(self, table_name: str, key: dict) -> dict:
+        '''Returns the item at [key] in [table_name], or None if it does not exist'''
+        response = await self.__call('get_item', TableName=table_name, Key=key)
+        return response.get('Item')
+
+    async def get_items(self, request_items: dict) -> dict:
+        '''Fans out one concurrent get_item per key in {table_name: [key, ...]}, returns {table_name: [item, ...]}'''
+        lookups = [(table_name, key) for table_name, keys in request_items.items() for key in keys]
+        items = await asyncio.gather(*(self.get_item(table_name, key) for table_name, key in lookups))
+        results = {table_name: [] for table_name in request_items}
+        for (table_name, _), item in zip(lookups, items):
+            if item is not None:
+                results[table_name].append(item)
+        return results
+
+    async def query(self, table_name: str, key_condition: str, attribute_names: dict, attribute_values: dict, index_name: str = None) -> list:
+        '''Returns every item matching [key_condition] in [table_name] (or its [index_name] index), following pagination'''
+        request = {
+            'TableName': table_name,
+            'KeyConditionExpression': key_condition,
+            'ExpressionAttributeNames': attribute_names,
+            'ExpressionAttributeValues': attribute_values
+        }
+        if index_name is not None:
+            request['IndexName'] = index_name
+        items = []
+        while True:
+            response = await self.__call('query', **request)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    async def batch_get_items(self, request_items: dict) -> dict:
+        '''Fetches every key in {table_name: [key, ...]} with as few BatchGetItem calls as possible
+
+        Returns {table_name: [item, ...]}; keys that do not exist are simply absent. If BatchGetItem
+        is not permitted (e.g. IAM only grants GetItem) this falls back to a concurrent get_item fan-out.'''
+        chunks = [{}]
+        chunk_size = 0
+        for table_name, keys in request_items.items():
+            for key in keys:
+                if chunk_size == BATCH_GET_ITEM_LIMIT:
+                    chunks.append({})
+                    chunk_size = 0
+                chunks[-1].setdefault(table_name, {'Keys': []})['Keys'].append(key)
+                chunk_size += 1
+        try:
+            chunk_results = await asyncio.gather(*(self.__batch_get_chunk(chunk) for chunk in chunks if chunk))
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('AccessDeniedException', 'ValidationException'):
+                raise
+            self.__logger.warning('BatchGetItem unavailable (%s), falling back to concurrent get_item', e)
+            return await self.get_items(request_items)
+        results = {table_name: [] for table_name in request_items}
+        for chunk_result in chunk_results:
+            for table_name, items in chunk_result.items():
+                results[table_name].extend(items)
+        return results
+
+    async def __batch_get_chunk(self, chunk: dict) -> dict:
+        '''Runs BatchGetItem for a single chunk, retrying UnprocessedKeys with exponential backoff'''
+        results = {}
+        pending = chunk
+        for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+            response = await self.__call('batch_get_item', RequestItems=pending)
+            for table_name, items in response.get('Responses', {}).items():
+                results.setdefault(table_name, []).extend(items)
+            pending = response.get('UnprocessedKeys')
+            if not pending:
+                return results
+            await asyncio.sleep(0.05 * 2 ** attempt)
+        raise RuntimeError(f'BatchGetItem left keys unprocessed after {MAX_UNPROCESSED_RETRIES} retries: {pending}')
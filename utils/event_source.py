@@ -0,0 +1,94 @@
+# event_source.py
+'''Reads events from either dynamodb layout: a table per city, or one table keyed by date + city'''
+# Disable:
+#   C0301: line length (unavoidable)
+#   R0913: too many arguments (table, index and logger are all optional settings)
+# pylint: disable=C0301,R0913
+
+import asyncio
+import datetime
+import logging
+
+from utils.dynamodb_loader import DynamoDBLoader
+from utils.event_store import event_from_item
+
+CITIES = (
+    'Brightwood',
+    'Cutlass Keys',
+    'Ebonscale Reach',
+    'Everfall',
+    'First Light',
+    "Monarch's Bluffs",
+    'Mourningdale',
+    'Reekwater',
+    'Restless Shore',
+    'Windsward',
+    "Weaver's Fen"
+)
+DEFAULT_CITY_INDEX_NAME = 'city-date-index'
+
+def city_table_name(table_prefix: str, city: str) -> str:
+    '''Returns the per-city event table for [city], e.g. events-monarchsbluffs'''
+    return table_prefix + ''.join(e for e in city if e.isalnum()).lower()
+
+def _search_dates(start_date: datetime.date, days: int) -> list:
+    return [(start_date + datetime.timedelta(days=day_offset)).strftime('%Y-%m-%d') for day_offset in range(days)]
+
+class PerCityEventSource:
+    '''Events spread over one table per city, each keyed by date'''
+    def __init__(self, loader: DynamoDBLoader, table_prefix: str, cities) -> None:
+        self.__loader = loader
+        self.__tables = {city: city_table_name(table_prefix, city) for city in cities}
+
+    async def load(self, start_date: datetime.date, days: int) -> list:
+        '''Returns every event from [start_date] for [days] days, with every (date, table) key in as few BatchGetItem calls as possible'''
+        date_keys = [{'date': {'S': search_date}} for search_date in _search_dates(start_date, days)]
+        response = await self.__loader.batch_get_items({table: date_keys for table in self.__tables.values()})
+        return [event_from_item(city, item) for city, table in self.__tables.items() for item in response[table]]
+
+    async def load_city(self, city: str, start_date: datetime.date, days: int) -> list:
+        '''Returns [city]'s events from [start_date] for [days] days from its own table'''
+        date_keys = [{'date': {'S': search_date}} for search_date in _search_dates(start_date, days)]
+        response = await self.__loader.batch_get_items({self.__tables[city]: date_keys})
+        return [event_from_item(city, item) for item in response[self.__tables[city]]]
+
+class SingleTableEventSource:
+    '''Events in one table with partition key date and sort key city, plus a [city_index_name] index keyed by city and date'''
+    def __init__(self, loader: DynamoDBLoader, table_name: str, cities, city_index_name: str = DEFAULT_CITY_INDEX_NAME, logger: logging.Logger = None) -> None:
+        self.__loader = loader
+        self.__table_name = table_name
+        self.__cities = set(cities)
+        self.__city_index_name = city_index_name
+        self.__logger = logger or logging.getLogger(__name__)
+
+    def __to_events(self, items: list) -> list:
+        events = []
+        for item in items:
+            city = item['city']['S']
+            if city not in self.__cities:
+                self.__logger.warning('Skipping event for unknown city %s on %s in %s', city, item['date']['S'], self.__table_name)
+                continue
+            events.append(event_from_item(city, item))
+        return events
+
+    async def load(self, start_date: datetime.date, days: int) -> list:
+        '''Returns every event from [start_date] for [days] days, one concurrent Query per day'''
+        day_items = await asyncio.gather(*(
+            self.__loader.query(self.__table_name, '#date = :date', {'#date': 'date'}, {':date': {'S': search_date}})
+            for search_date in _search_dates(start_date, days)
+        ))
+        return self.__to_events([item for items in day_items for item in items])
+
+    async def load_city(self, city: str, start_date: datetime.date, days: int) -> list:
+        '''Returns [city]'s events from [start_date] for [days] days with one Query on the city index'''
+        search_dates = _search_dates(start_date, days)
+        if not search_dates:
+            return []
+        items = await self.__loader.query(
+            self.__table_name,
+            '#city = :city AND #date BETWEEN :start AND :end',
+            {'#city': 'city', '#date': 'date'},
+            {':city': {'S': city}, ':start': {'S': search_dates[0]}, ':end': {'S': search_dates[-1]}},
+            index_name=self.__city_index_name
+        )
+        return self.__to_events(items)
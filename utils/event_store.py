@@ -0,0 +1,105 @@
+# event_store.py
+'''Wars and invasions for a range of days, indexed by (date, city) and ordered by siege time'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import datetime
+from typing import NamedTuple
+
+from utils.siege_schedule import SiegeSchedule
+
+class Event(NamedTuple):
+    '''One war or invasion, as stored in a city's event table'''
+    date: datetime.date
+    city: str
+    event_type: str # invasion or war
+    attacker: str
+    defender: str
+
+def event_from_item(city: str, item: dict) -> Event:
+    '''Returns the Event for a dynamodb item from [city]'s event table'''
+    return Event(
+        date=datetime.datetime.strptime(item['date']['S'], '%Y-%m-%d').date(),
+        city=city,
+        event_type=item['type']['S'],
+        attacker=item['attacker']['S'],
+        defender=item['defender']['S']
+    )
+
+class EventStore:
+    '''Immutable set of events from [start_date] for [days] days, each day's events sorted by [schedule]
+
+    Cities without a siege window in [schedule] sort after the rest.'''
+    def __init__(self, events, start_date: datetime.date, days: int, schedule: SiegeSchedule = None) -> None:
+        self.start_date = start_date
+        self.days = days
+        self.__schedule = schedule if schedule is not None else SiegeSchedule({})
+        end_date = self.end_date
+        self.__by_key = {(event.date, event.city): event for event in events if start_date <= event.date < end_date}
+        by_date = {}
+        for event in self.__by_key.values():
+            by_date.setdefault(event.date, []).append(event)
+        self.__by_date = {date: tuple(sorted(day_events, key=self.__start_key)) for date, day_events in by_date.items()}
+
+    def __start_key(self, event: Event) -> tuple:
+        minute = self.__schedule.minute_of_day(event.city) if event.city in self.__schedule else 24 * 60
+        return minute, event.city
+
+    def __len__(self) -> int:
+        return len(self.__by_key)
+
+    @property
+    def end_date(self) -> datetime.date:
+        '''The first date after the store's range'''
+        return self.start_date + datetime.timedelta(days=self.days)
+
+    def covers(self, date: datetime.date) -> bool:
+        '''Returns True if [date] is inside the loaded range, so a missing event means there is none'''
+        return self.start_date <= date < self.end_date
+
+    def get(self, date: datetime.date, city: str) -> Event:
+        '''Returns [city]'s event on [date], or None'''
+        return self.__by_key.get((date, city))
+
+    def on(self, date: datetime.date) -> tuple:
+        '''Returns the events on [date] in siege time order'''
+        return self.__by_date.get(date, ())
+
+    def events(self) -> list:
+        '''Returns every event ordered by date, then siege time'''
+        return [event for date in sorted(self.__by_date) for event in self.__by_date[date]]
+
+    def with_schedule(self, schedule: SiegeSchedule):
+        '''Returns a copy of the store ordered by [schedule]'''
+        return EventStore(self.__by_key.values(), self.start_date, self.days, schedule)
+
+    def with_city_events(self, city: str, city_events):
+        '''Returns a copy with [city]'s events replaced by [city_events]'''
+        kept_events = [event for event in self.__by_key.values() if event.city != city]
+        return EventStore(kept_events + [event for event in city_events if event.city == city], self.start_date, self.days, self.__schedule)
+
+    def city_events(self, city: str) -> list:
+        '''Returns [city]'s events ordered by date'''
+        return sorted((event for event in self.__by_key.values() if event.city == city), key=lambda event: event.date)
+
+    def since(self, start_date: datetime.date):
+        '''Returns a copy without the days before [start_date], keeping the same end date'''
+        return EventStore(self.__by_key.values(), start_date, max(0, (self.end_date - start_date).days), self.__schedule)
+
+    def to_dict(self) -> dict:
+        '''Returns the store as JSON-serializable values'''
+        return {
+            'start_date': self.start_date.isoformat(),
+            'days': self.days,
+            'events': [[event.date.isoformat(), event.city, event.event_type, event.attacker, event.defender] for event in self.events()]
+        }
+
+    @classmethod
+    def from_dict(cls, store: dict, schedule: SiegeSchedule = None):
+        '''Returns the store saved by to_dict()'''
+        events = [
+            Event(datetime.datetime.strptime(date, '%Y-%m-%d').date(), city, event_type, attacker, defender)
+            for date, city, event_type, attacker, defender in store['events']
+        ]
+        return cls(events, datetime.datetime.strptime(store['start_date'], '%Y-%m-%d').date(), int(store['days']), schedule)
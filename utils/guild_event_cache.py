@@ -0,0 +1,66 @@
+# guild_event_cache.py
+'''Each guild's recently listed scheduled events, reconciles close together share one REST list'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import datetime
+import time
+
+FINISHED_EVENT_STATUSES = (3, 4) # completed and canceled events are never reconciled, so they are not kept
+LISTED_GUILD_TTL = 300 # seconds a list is trusted, nothing reports events users delete or that finish in between
+
+def parse_event_time(timestamp: str) -> datetime.datetime:
+    '''Returns a UTC datetime for a Discord ISO8601 timestamp, treating timestamps without an offset as UTC'''
+    parsed = datetime.datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc)
+
+class GuildEventCache:
+    '''Scheduled events per guild from a list_guild_events() call, updated by the bot's own creates, patches and deletes
+
+    A listed guild is loaded for [listed_ttl] seconds, after that it has to be listed again. discord.py 1.7 uses
+    gateway v6, which has no scheduled event dispatches, so changes made by users only show up in a new list.
+    Events that have started are dropped, they are no longer scheduled and nothing tells the cache when they finish.'''
+    def __init__(self, listed_ttl: float = LISTED_GUILD_TTL) -> None:
+        self.__events = {} # guild_id -> {event_id: event}
+        self.__listed_at = {} # guild_id -> monotonic time it was listed
+        self.__listed_ttl = listed_ttl
+
+    def is_loaded(self, guild_id: str) -> bool:
+        '''Returns True if [guild_id] was listed in the last [listed_ttl] seconds'''
+        listed_at = self.__listed_at.get(str(guild_id))
+        return listed_at is not None and time.monotonic() - listed_at < self.__listed_ttl
+
+    def events(self, guild_id: str) -> list:
+        '''Returns the known scheduled events in [guild_id] that have not started yet'''
+        guild_events = self.__events.get(str(guild_id), {})
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for event_id in [event_id for event_id, event in guild_events.items() if parse_event_time(event['scheduled_start_time']) <= now]:
+            del guild_events[event_id]
+        return list(guild_events.values())
+
+    def replace_guild(self, guild_id: str, events: list) -> None:
+        '''Sets the full list of scheduled events in [guild_id] and marks it loaded'''
+        self.__events[str(guild_id)] = {str(event['id']): event for event in events if event.get('status') not in FINISHED_EVENT_STATUSES}
+        self.__listed_at[str(guild_id)] = time.monotonic()
+
+    def forget_guild(self, guild_id: str) -> None:
+        '''Drops [guild_id] so the next reconcile lists its events again'''
+        self.__events.pop(str(guild_id), None)
+        self.__listed_at.pop(str(guild_id), None)
+
+    def upsert(self, event: dict) -> None:
+        '''Adds or replaces a scheduled event, e.g. from a create or patch response'''
+        if event.get('status') in FINISHED_EVENT_STATUSES:
+            self.remove(event['guild_id'], event['id'])
+            return
+        self.__events.setdefault(str(event['guild_id']), {})[str(event['id'])] = event
+
+    def remove(self, guild_id: str, event_id: str) -> None:
+        '''Removes a scheduled event if it is known'''
+        self.__events.get(str(guild_id), {}).pop(str(event_id), None)
+
+    def __len__(self) -> int:
+        return sum(len(guild_events) for guild_events in self.__events.values())
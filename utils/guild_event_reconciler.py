@@ -0,0 +1,145 @@
+# guild_event_reconciler.py
+'''Brings each guild's scheduled events in line with the events the bot knows about'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import asyncio
+import logging
+
+import aiohttp
+from utils.discord_commands import DiscordAPIError, DiscordCommands
+from utils.guild_event_cache import GuildEventCache, parse_event_time
+
+SCHEDULED_EVENT_STATUS = 1 # only events that have not started yet are reconciled
+UNKNOWN_SCHEDULED_EVENT_CODE = 10070 # the event was deleted since the guild was listed
+
+def diff_guild_events(existing_events: list, desired_events: list, is_managed) -> tuple:
+    '''Returns (to_create, to_patch, to_delete) that turn a guild's [existing_events] into [desired_events]
+
+    to_create is a list of payloads, to_patch a list of (event_id, changes) and to_delete a list of event IDs.
+    Only scheduled events for which is_managed(event) is true are ever patched or deleted.'''
+    managed = [
+        event for event in existing_events
+        if event.get('status', SCHEDULED_EVENT_STATUS) == SCHEDULED_EVENT_STATUS and is_managed(event)
+    ]
+    unmatched_existing = {}
+    for event in managed:
+        key = (event['name'], parse_event_time(event['scheduled_start_time']))
+        unmatched_existing.setdefault(key, []).append(event)
+    to_patch = []
+    unmatched_desired = []
+    for payload in desired_events:
+        key = (payload['name'], parse_event_time(payload['scheduled_start_time']))
+        if unmatched_existing.get(key):
+            event = unmatched_existing[key].pop(0)
+            changes = {}
+            if (event.get('description') or '') != payload['description']:
+                changes['description'] = payload['description']
+            if event.get('scheduled_end_time') and parse_event_time(event['scheduled_end_time']) != parse_event_time(payload['scheduled_end_time']):
+                changes['scheduled_end_time'] = payload['scheduled_end_time']
+            if changes:
+                to_patch.append((event['id'], changes))
+        else:
+            unmatched_desired.append(payload)
+    # anything left over with the same name was rescheduled, patch it instead of recreating it
+    leftover_by_name = {}
+    for events in unmatched_existing.values():
+        for event in events:
+            leftover_by_name.setdefault(event['name'], []).append(event)
+    to_create = []
+    for payload in unmatched_desired:
+        if leftover_by_name.get(payload['name']):
+            event = leftover_by_name[payload['name']].pop(0)
+            to_patch.append((event['id'], {
+                'scheduled_start_time': payload['scheduled_start_time'],
+                'scheduled_end_time': payload['scheduled_end_time'],
+                'description': payload['description']
+            }))
+        else:
+            to_create.append(payload)
+    to_delete = [event['id'] for events in leftover_by_name.values() for event in events]
+    return to_create, to_patch, to_delete
+
+class GuildEventReconciler:
+    '''Creates, patches and deletes guild scheduled events so every guild matches one shared set of payloads
+
+    Existing events come from [cache] for guilds listed recently, other guilds are listed and cached.'''
+    def __init__(self, client: DiscordCommands, is_managed, max_concurrent_guilds: int = 5, logger: logging.Logger = None, cache: GuildEventCache = None) -> None:
+        self.__client = client
+        self.__is_managed = is_managed
+        self.__max_concurrent_guilds = max_concurrent_guilds
+        self.__logger = logger or logging.getLogger(__name__)
+        self.cache = cache if cache is not None else GuildEventCache()
+
+    async def reconcile(self, guild_ids: list, desired_events: list) -> dict:
+        '''Reconciles every guild in [guild_ids] against [desired_events], returns {guild_id: result counts}'''
+        semaphore = asyncio.Semaphore(self.__max_concurrent_guilds)
+
+        async def reconcile_with_limit(guild_id):
+            async with semaphore:
+                return await self.reconcile_guild(str(guild_id), desired_events)
+
+        results = await asyncio.gather(*(reconcile_with_limit(guild_id) for guild_id in guild_ids), return_exceptions=True)
+        reconciled = {}
+        for guild_id, result in zip(guild_ids, results):
+            if isinstance(result, Exception): # one guild failing does not stop the others
+                if isinstance(result, (aiohttp.ClientError, asyncio.TimeoutError)):
+                    self.__logger.error('Failed to reconcile events for guild %s: %r', guild_id, result)
+                else:
+                    self.__logger.error('Failed to reconcile events for guild %s', guild_id, exc_info=result)
+                self.cache.forget_guild(str(guild_id)) # writes may have landed without their responses
+                result = {'created': 0, 'updated': 0, 'deleted': 0, 'failed': 1, 'listed': 0}
+            reconciled[guild_id] = result
+        return reconciled
+
+    async def reconcile_guild(self, guild_id: str, desired_events: list) -> dict:
+        '''Reconciles a single guild, returns counts of created, updated, deleted and failed events'''
+        result = {'created': 0, 'updated': 0, 'deleted': 0, 'failed': 0, 'listed': 0}
+        if not self.cache.is_loaded(guild_id):
+            try:
+                self.cache.replace_guild(guild_id, await self.__client.list_guild_events(guild_id))
+                result['listed'] += 1
+            except DiscordAPIError as e:
+                self.__logger.error('Failed to list events for guild %s: %s', guild_id, e)
+                result['failed'] += 1
+                return result
+        to_create, to_patch, to_delete = diff_guild_events(self.cache.events(guild_id), desired_events, self.__is_managed)
+        self.__logger.debug('Guild %s needs %s creates, %s patches, %s deletes', guild_id, len(to_create), len(to_patch), len(to_delete))
+        for payload in to_create:
+            try:
+                self.__cache_response(guild_id, await self.__client.post_guild_event(guild_id, payload))
+                result['created'] += 1
+            except DiscordAPIError as e:
+                self.__logger.error("Failed to create event [%s] for guild %s: %s", payload['name'], guild_id, e)
+                result['failed'] += 1
+        for event_id, changes in to_patch:
+            try:
+                self.__cache_response(guild_id, await self.__client.modify_guild_event(guild_id, event_id, changes))
+                result['updated'] += 1
+            except DiscordAPIError as e:
+                self.__logger.error('Failed to update event %s for guild %s: %s', event_id, guild_id, e)
+                result['failed'] += 1
+                self.__forget_stale(guild_id, event_id, e)
+        for event_id in to_delete:
+            try:
+                await self.__client.delete_guild_event(guild_id, event_id)
+                self.cache.remove(guild_id, event_id)
+                result['deleted'] += 1
+            except DiscordAPIError as e:
+                self.__logger.error('Failed to delete event %s for guild %s: %s', event_id, guild_id, e)
+                result['failed'] += 1
+                self.__forget_stale(guild_id, event_id, e)
+        return result
+
+    def __cache_response(self, guild_id: str, event: dict) -> None:
+        '''Caches an event returned by a create or patch, so the next reconcile within the cache's TTL sees it'''
+        if isinstance(event, dict) and 'id' in event:
+            self.cache.upsert(dict(event, guild_id=event.get('guild_id', guild_id)))
+
+    def __forget_stale(self, guild_id: str, event_id: str, error: DiscordAPIError) -> None:
+        '''Drops a cached event Discord no longer has, and the whole guild for any other error so it is listed again'''
+        if error.code == UNKNOWN_SCHEDULED_EVENT_CODE:
+            self.cache.remove(guild_id, event_id)
+        else:
+            self.cache.forget_guild(guild_id)
@@ -0,0 +1,64 @@
+# log_pipeline.py
+'''Queue-based logging so formatting and disk writes happen on a background thread'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import atexit
+import datetime
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+class DeferredQueueHandler(QueueHandler):
+    '''QueueHandler that leaves message formatting to the listener thread
+
+    The stdlib QueueHandler formats every record on the calling thread so it can be pickled; the queue here
+    never leaves the process, so the record is passed through untouched and formatted by the writer.'''
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class JSONFormatter(logging.Formatter):
+    '''Formats records as one JSON object per line'''
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+def configure_logging(logger: logging.Logger, handler: logging.Handler, level: str = 'DEBUG', json_format: bool = False) -> QueueListener:
+    '''Routes [logger] through a queue to [handler], which runs on a background thread, and returns the started listener'''
+    if json_format:
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)-16s - %(levelname)-8s - %(message)s'))
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    logger.setLevel(level)
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop) # flushes anything still queued on shutdown
+    return listener
+
+def set_log_level(logger: logging.Logger, level: str) -> str:
+    '''Sets [logger] to [level] (e.g. INFO) and returns the previous level name'''
+    if level.upper() not in LOG_LEVELS:
+        raise ValueError(f'Unknown log level: {level}')
+    previous_level = logging.getLevelName(logger.level)
+    logger.setLevel(level.upper())
+    return previous_level
+
+def cycle_log_level(logger: logging.Logger) -> str:
+    '''Moves [logger] to the next level in LOG_LEVELS (wrapping back to DEBUG) and returns the new level name'''
+    current_level = logging.getLevelName(logger.level)
+    next_index = (LOG_LEVELS.index(current_level) + 1) % len(LOG_LEVELS) if current_level in LOG_LEVELS else 0
+    set_log_level(logger, LOG_LEVELS[next_index])
+    return LOG_LEVELS[next_index]
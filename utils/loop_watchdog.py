@@ -0,0 +1,144 @@
+# loop_watchdog.py
+'''Shows what blocks the event loop: a lag watchdog logging stuck stacks and a sampling profiler'''
+# Disable:
+#   C0301: line length (unavoidable)
+#   W0212: protected access (sys._current_frames is the only way to read another thread's stack)
+# pylint: disable=C0301,W0212
+
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import NamedTuple
+
+from utils.metrics import REGISTRY
+
+IDLE_FUNCTIONS = {'select', 'poll', 'epoll', '_run_once', 'run_forever'} # the loop waiting for I/O, not busy
+
+def _frame_label(frame) -> str:
+    return f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}'
+
+def _stack_labels(frame, max_depth: int) -> tuple:
+    '''Returns up to [max_depth] innermost frames of [frame]'s stack as labels, outermost first'''
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+class WatchdogSettings(NamedTuple):
+    '''How often the loop is checked and how late a heartbeat may run before its stack is logged, in seconds'''
+    threshold: float
+    interval: float
+
+class LoopWatchdog:
+    '''Schedules a heartbeat on the loop every [interval] seconds and watches it from a daemon thread
+
+    Every heartbeat's lateness goes into the event_loop_lag_seconds histogram. When a heartbeat is more than
+    [threshold] seconds overdue the loop thread's current stack is logged once, then the stall's total length
+    when the loop catches up.'''
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1, logger: logging.Logger = None) -> None:
+        self.settings = WatchdogSettings(threshold, interval)
+        self.__logger = logger or logging.getLogger(__name__)
+        self.__loop = None
+        self.__loop_thread_id = None
+        self.__expected_at = None # monotonic time the pending heartbeat should run at
+        self.__stall_reported = False
+        self.__lag = REGISTRY.histogram('event_loop_lag_seconds', 'How late event loop heartbeats run', buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+    @property
+    def loop_thread_id(self) -> int:
+        '''Thread ID of the watched loop, known after its first heartbeat'''
+        return self.__loop_thread_id
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        '''Starts the heartbeat on [loop] (it may not be running yet) and the watching thread'''
+        self.__loop = loop
+        self.__expected_at = time.monotonic() + self.settings.interval
+        loop.call_soon_threadsafe(self.__schedule_beat)
+        threading.Thread(target=self.__watch, name='loop-watchdog', daemon=True).start()
+
+    def __schedule_beat(self) -> None:
+        self.__loop_thread_id = threading.get_ident()
+        self.__expected_at = time.monotonic() + self.settings.interval
+        self.__loop.call_later(self.settings.interval, self.__beat)
+
+    def __beat(self) -> None:
+        lag = max(0.0, time.monotonic() - self.__expected_at)
+        self.__lag.observe(lag)
+        if self.__stall_reported:
+            self.__logger.warning('Event loop was blocked for %.2f seconds', lag)
+            self.__stall_reported = False
+        self.__schedule_beat()
+
+    def __watch(self) -> None:
+        while True:
+            time.sleep(self.settings.interval)
+            if self.__loop.is_closed():
+                return
+            overdue = time.monotonic() - self.__expected_at
+            if overdue <= self.settings.threshold or self.__stall_reported or self.__loop_thread_id is None:
+                continue
+            frame = sys._current_frames().get(self.__loop_thread_id)
+            if frame is None or frame.f_code.co_name in IDLE_FUNCTIONS: # waiting for the loop to start, or not actually stuck
+                continue
+            self.__stall_reported = True
+            self.__logger.warning(
+                'Event loop blocked for %.2f seconds so far, loop thread is at:\n%s',
+                overdue,
+                ''.join(traceback.format_stack(frame)).rstrip()
+            )
+
+def sample_thread(thread_id: int, seconds: float, sample_interval: float = 0.005, max_depth: int = 8) -> collections.Counter:
+    '''Samples [thread_id]'s stack every [sample_interval] for [seconds], returns a Counter of stacks (see _stack_labels)
+
+    Samples where the thread is waiting in the event loop's selector are counted under ('idle',).'''
+    samples = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        samples[('idle',) if frame.f_code.co_name in IDLE_FUNCTIONS else _stack_labels(frame, max_depth)] += 1
+        del frame # do not keep the sampled thread's frames alive between samples
+        time.sleep(sample_interval)
+    return samples
+
+def format_profile(samples: collections.Counter, seconds: float, limit: int = 10) -> str:
+    '''Returns the [limit] hottest call paths and innermost functions in [samples] as a plain text report'''
+    total = sum(samples.values())
+    if not total:
+        return 'No samples were taken, is the event loop running?'
+    busy = total - samples[('idle',)]
+    lines = [f'{total} samples over {seconds:g}s, loop busy in {busy / total:.1%}']
+    leaf_counts = collections.Counter()
+    for stack, count in samples.items():
+        if stack != ('idle',):
+            leaf_counts[stack[-1].rsplit(':', 1)[0]] += count
+    lines.append('Hottest functions (innermost frame):')
+    lines.extend(f'{count / total:6.1%}  {leaf}' for leaf, count in leaf_counts.most_common(limit))
+    lines.append('Hottest call paths (outermost first):')
+    for stack, count in samples.most_common(limit + 1):
+        if stack != ('idle',):
+            lines.append(f"{count / total:6.1%}  {' > '.join(stack)}")
+    return '\n'.join(lines[:2 * limit + 3])
+
+async def profile_loop_thread(thread_id: int, seconds: float) -> str:
+    '''Samples [thread_id] for [seconds] on a short-lived thread and returns format_profile()'s report'''
+    loop = asyncio.get_event_loop()
+    future = loop.create_future()
+
+    def run() -> None:
+        try:
+            report = format_profile(sample_thread(thread_id, seconds), seconds)
+        except Exception as e: # pylint: disable=W0703
+            loop.call_soon_threadsafe(future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(future.set_result, report)
+
+    threading.Thread(target=run, name='loop-profiler', daemon=True).start()
+    return await future
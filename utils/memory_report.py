@@ -0,0 +1,52 @@
+# memory_report.py
+'''Process memory use and the top tracemalloc allocators as a plain text report'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import datetime
+import os
+import resource
+import tracemalloc
+
+TRACEMALLOC_FRAMES = 1 # one frame per allocation keeps tracing overhead low
+_IGNORED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>')
+
+def _current_rss_bytes() -> int:
+    '''Returns the resident set size from /proc, or None where it is not available'''
+    try:
+        with open('/proc/self/statm', encoding='utf-8') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def build_memory_report(limit: int = 15) -> str:
+    '''Returns RSS, traced memory and the [limit] source lines holding the most memory
+
+    Tracing starts with the first report if it is not running yet (set PYTHONTRACEMALLOC=1 or TRACEMALLOC=true to
+    trace from startup), so that report only has the process totals.'''
+    lines = [f'Memory report at {datetime.datetime.now(datetime.timezone.utc).isoformat()}']
+    current_rss = _current_rss_bytes()
+    if current_rss is not None:
+        lines.append(f'RSS: {current_rss / 1048576:.1f} MiB')
+    lines.append(f'Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB') # ru_maxrss is KiB on linux
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        lines.append('tracemalloc was not running and has been started, request another report for the top allocators')
+        return '\n'.join(lines)
+    traced_current, traced_peak = tracemalloc.get_traced_memory()
+    lines.append(f'Traced: {traced_current / 1048576:.1f} MiB now, {traced_peak / 1048576:.1f} MiB peak')
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, filename) for filename in _IGNORED_FILES])
+    statistics = snapshot.statistics('lineno')
+    lines.append(f'Top {min(limit, len(statistics))} allocators:')
+    for index, statistic in enumerate(statistics[:limit], start=1):
+        frame = statistic.traceback[0]
+        lines.append(f'{index:>3}. {statistic.size / 1024:>9.1f} KiB {statistic.count:>7} blocks  {frame.filename}:{frame.lineno}')
+    return '\n'.join(lines)
+
+def write_memory_report(path: str, limit: int = 15) -> str:
+    '''Writes build_memory_report() to [path] and returns the report'''
+    report = build_memory_report(limit)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(report + '\n')
+    return report
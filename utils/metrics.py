@@ -0,0 +1,169 @@
+# metrics.py
+'''In-process counters and latency histograms, exposed in the Prometheus text format'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import asyncio
+import bisect
+import contextlib
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(label_key: tuple, extra: tuple = ()) -> str:
+    pairs = label_key + extra
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Counter:
+    '''Monotonic count per label set'''
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        '''Adds [amount] to the series for [labels]'''
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list:
+        '''Returns Prometheus exposition lines'''
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{_format_labels(key)} {value}' for key, value in sorted(self.values.items()))
+        return lines
+
+class Histogram:
+    '''Fixed-bucket latency histogram per label set'''
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.series = {} # label key -> [bucket counts..., +Inf count], sum
+
+    def observe(self, value: float, **labels) -> None:
+        '''Records one observation of [value] seconds for [labels]'''
+        key = _label_key(labels)
+        if key not in self.series:
+            self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        counts, _ = self.series[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.series[key][1] += value
+
+    def quantile(self, q: float, **labels) -> float:
+        '''Estimates the [q] quantile for [labels] by interpolating within buckets, None without observations'''
+        key = _label_key(labels)
+        if key not in self.series:
+            return None
+        counts, _ = self.series[key]
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets): # +Inf bucket, best we can say is the largest bound
+                    return self.buckets[-1]
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def count(self, **labels) -> int:
+        '''Returns the number of observations for [labels]'''
+        key = _label_key(labels)
+        return sum(self.series[key][0]) if key in self.series else 0
+
+    def render(self) -> list:
+        '''Returns Prometheus exposition lines'''
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for key, (counts, total_sum) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', bound),))} {cumulative}")
+            lines.append(f'{self.name}_sum{_format_labels(key)} {total_sum}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {cumulative}')
+        return lines
+
+class MetricsRegistry:
+    '''Holds every metric so they can be rendered together'''
+    def __init__(self) -> None:
+        self.metrics = {}
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        '''Returns the counter called [name], creating it on first use'''
+        return self.metrics.setdefault(name, Counter(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        '''Returns the histogram called [name], creating it on first use'''
+        return self.metrics.setdefault(name, Histogram(name, documentation, buckets))
+
+    @contextlib.contextmanager
+    def timed(self, name: str, documentation: str, **labels):
+        '''Records the duration of the block in [name]_seconds and counts exceptions in [name]_errors_total'''
+        histogram = self.histogram(f'{name}_seconds', documentation)
+        errors = self.counter(f'{name}_errors_total', f'Errors raised while measuring {name}_seconds')
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            errors.inc(**labels)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        '''Returns every metric in the Prometheus text exposition format'''
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        '''Returns a short human readable table of count, errors, p50 and p99 for every histogram series'''
+        lines = []
+        for name in sorted(self.metrics):
+            histogram = self.metrics[name]
+            if not isinstance(histogram, Histogram):
+                continue
+            errors = self.metrics.get(name[:-len('_seconds')] + '_errors_total') if name.endswith('_seconds') else None
+            for key in sorted(histogram.series):
+                labels = dict(key)
+                error_count = errors.values.get(key, 0) if errors is not None else 0
+                lines.append(
+                    f'{name}{_format_labels(key)}: n={histogram.count(**labels)} errors={error_count:g} '
+                    f'p50={histogram.quantile(0.5, **labels) * 1000:.0f}ms p99={histogram.quantile(0.99, **labels) * 1000:.0f}ms'
+                )
+        return '\n'.join(lines) or 'No metrics recorded yet'
+
+REGISTRY = MetricsRegistry()
+
+async def start_metrics_server(registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9108):
+    '''Serves [registry] at http://[host]:[port]/metrics and returns the asyncio server'''
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip(): # discard headers
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,68 @@
+# poll_schedule.py
+'''Picks the delay before the next poll: sooner after changes, later while quiet or failing'''
+# Disable:
+#   C0301: line length (unavoidable)
+#   R0902: too many instance attributes (each tuning knob is public, the bot logs open_seconds)
+#   R0913: too many arguments (every interval is configurable)
+# pylint: disable=C0301,R0902,R0913
+
+import random
+
+CLOSED = 'closed' # polling normally
+OPEN = 'open' # too many failures in a row, polls wait [open_seconds] until one succeeds
+
+class AdaptivePollSchedule:
+    '''Delay policy with jitter, exponential backoff on failures and a circuit breaker
+
+    After a change, or while something is unavailable, polls run every [fast_interval] for the next
+    [fast_polls] polls. Each quiet poll after that stretches the delay by [quiet_growth] up to [max_interval].
+    Failures double the delay from [base_interval] up to [max_interval], and [failure_threshold] failures in a
+    row open the circuit: polls then run every [open_seconds] and the first success closes it again.'''
+    def __init__(self, base_interval: float = 60, fast_interval: float = 20, max_interval: float = 180, fast_polls: int = 6,
+                 quiet_growth: float = 1.25, failure_threshold: int = 5, open_seconds: float = 900, jitter: float = 0.1, rnd: random.Random = None) -> None:
+        self.base_interval = base_interval
+        self.fast_interval = fast_interval
+        self.max_interval = max_interval
+        self.fast_polls = fast_polls
+        self.quiet_growth = quiet_growth
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.jitter = jitter
+        self.__rnd = rnd or random.Random()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.__interval = base_interval # delay before jitter for the next poll
+        self.__fast_polls_left = 0
+
+    def __jittered(self, delay: float) -> float:
+        return delay * self.__rnd.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def record_success(self, changed: bool = False, unavailable: bool = False) -> str:
+        '''Records a successful poll that saw a change or an unavailable target, returns the previous circuit state'''
+        previous_state = self.state
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        if changed or unavailable:
+            self.__fast_polls_left = self.fast_polls
+        if self.__fast_polls_left > 0:
+            self.__fast_polls_left -= 1
+            self.__interval = self.fast_interval
+        elif previous_state != CLOSED:
+            self.__interval = self.base_interval
+        else:
+            self.__interval = min(self.max_interval, max(self.base_interval, self.__interval * self.quiet_growth))
+        return previous_state
+
+    def record_failure(self) -> str:
+        '''Records a failed poll, returns the new circuit state'''
+        self.consecutive_failures += 1
+        if self.state == OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+        self.__interval = min(self.max_interval, self.base_interval * 2 ** (self.consecutive_failures - 1))
+        return self.state
+
+    def next_delay(self) -> float:
+        '''Returns the seconds to wait before the next poll, calling it does not change the schedule'''
+        if self.state == OPEN:
+            return self.__jittered(self.open_seconds)
+        return self.__jittered(self.__interval)
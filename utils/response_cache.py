@@ -0,0 +1,37 @@
+# response_cache.py
+'''Pre-rendered slash command responses that are rebuilt only when their content can change'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import datetime
+
+COUNTDOWN_PLACEHOLDER = '{countdown}'
+
+class ResponseCache:
+    '''Caches rendered responses by key until the renderer's expiry time passes
+
+    renderer() is a coroutine returning ({key: (text, countdown_target)}, expires_at). Texts may contain
+    COUNTDOWN_PLACEHOLDER, which get() fills with countdown(countdown_target) at request time.'''
+    def __init__(self, renderer, countdown) -> None:
+        self.__renderer = renderer
+        self.__countdown = countdown
+        self.__responses = {}
+        self.__expires_at = None # aware datetime the responses go stale, None until first built
+
+    async def rebuild(self) -> None:
+        '''Renders every response from the current data'''
+        self.__responses, self.__expires_at = await self.__renderer()
+
+    def invalidate(self) -> None:
+        '''Drops the rendered responses so the next get() rebuilds them'''
+        self.__expires_at = None
+
+    async def get(self, key) -> str:
+        '''Returns the response for [key], rebuilding first if a siege time has passed since the last build'''
+        if self.__expires_at is None or datetime.datetime.now(datetime.timezone.utc) >= self.__expires_at:
+            await self.rebuild()
+        text, countdown_target = self.__responses[key]
+        if countdown_target is not None:
+            text = text.replace(COUNTDOWN_PLACEHOLDER, await self.__countdown(countdown_target))
+        return text
@@ -0,0 +1,69 @@
+# sharding.py
+'''Decides which guilds and channels a process serves when the bot is split across gateway shards'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import discord
+
+def shard_id_for_guild(guild_id: int, shard_count: int) -> int:
+    '''Returns the shard Discord routes [guild_id] to, see https://discord.com/developers/docs/topics/gateway#sharding'''
+    return (int(guild_id) >> 22) % shard_count
+
+class ShardPlan:
+    '''The shards this process runs out of [shard_count], or a single unsharded client if [shard_count=None]
+
+    Several processes can split the shards between them with [shard_ids]. The process running shard 0 is the
+    data leader: it is the only one that loads from dynamodb, the others read the snapshot it writes.'''
+    def __init__(self, shard_count: int = None, shard_ids: list = None) -> None:
+        if shard_count is None:
+            if shard_ids:
+                raise ValueError('SHARD_IDS requires SHARD_COUNT')
+            self.shard_count = None
+            self.shard_ids = None
+            return
+        if shard_count < 1:
+            raise ValueError(f'SHARD_COUNT must be at least 1, got {shard_count}')
+        shard_ids = sorted(set(shard_ids)) if shard_ids else list(range(shard_count))
+        if shard_ids[0] < 0 or shard_ids[-1] >= shard_count:
+            raise ValueError(f'SHARD_IDS {shard_ids} must be between 0 and {shard_count - 1}')
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+
+    @classmethod
+    def from_config(cls, config: dict):
+        '''Builds a plan from the SHARD_COUNT and comma separated SHARD_IDS settings, both optional'''
+        shard_count = int(config['SHARD_COUNT']) if config.get('SHARD_COUNT') else None
+        shard_ids = [int(shard_id) for shard_id in config.get('SHARD_IDS', '').split(',') if shard_id.strip()]
+        return cls(shard_count, shard_ids)
+
+    @property
+    def sharded(self) -> bool:
+        '''True if the bot connects with an AutoShardedClient'''
+        return self.shard_count is not None
+
+    @property
+    def owns_all_shards(self) -> bool:
+        '''True if this process serves every guild, so a channel missing from its cache is an error'''
+        return not self.sharded or len(self.shard_ids) == self.shard_count
+
+    @property
+    def is_data_leader(self) -> bool:
+        '''True if this process loads data from dynamodb and writes the shared snapshot'''
+        return not self.sharded or 0 in self.shard_ids
+
+    def owns_guild(self, guild_id: int) -> bool:
+        '''Returns True if [guild_id]'s shard runs in this process'''
+        return self.owns_all_shards or shard_id_for_guild(guild_id, self.shard_count) in self.shard_ids
+
+    def create_client(self, **options) -> discord.Client:
+        '''Returns a discord.Client, or an AutoShardedClient running this process's shards'''
+        if not self.sharded:
+            return discord.Client(**options)
+        return discord.AutoShardedClient(shard_count=self.shard_count, shard_ids=self.shard_ids, **options)
+
+    def describe(self) -> str:
+        '''Returns a short description for logs'''
+        if not self.sharded:
+            return 'unsharded'
+        return f"shards {','.join(str(shard_id) for shard_id in self.shard_ids)} of {self.shard_count}"
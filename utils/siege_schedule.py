@@ -0,0 +1,111 @@
+# siege_schedule.py
+'''Precomputed, timezone-aware index of each city's daily siege window'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import bisect
+import datetime
+
+from dateutil import tz
+
+SERVER_TIMEZONE_NAME = 'America/New_York' # siege windows are published in server (EST/EDT) time
+SERVER_TIMEZONE = tz.gettz(SERVER_TIMEZONE_NAME)
+
+def parse_siege_time(time_str: str) -> int:
+    '''Returns the minute of the day for a string with style 08:30 PM, e.g. 1230 (12:00 AM is 0, 12:00 PM is 720)'''
+    clock, ampm = time_str.strip().split(' ')
+    hour_str, minute_str = clock.split(':')
+    hour, minute = int(hour_str), int(minute_str)
+    if not 1 <= hour <= 12 or not 0 <= minute < 60 or ampm.upper() not in ('AM', 'PM'):
+        raise ValueError(f'Invalid siege time: {time_str}')
+    return (hour % 12 + (12 if ampm.upper() == 'PM' else 0)) * 60 + minute
+
+def server_now() -> datetime.datetime:
+    '''Returns the current time in the server timezone'''
+    return datetime.datetime.now(SERVER_TIMEZONE)
+
+def server_today() -> datetime.date:
+    '''Returns the current date in the server timezone'''
+    return server_now().date()
+
+def format_duration(duration: datetime.timedelta) -> str:
+    '''Returns a string with style 1h5m, rounding minutes up'''
+    total_minutes = max(0, -(-int(duration.total_seconds()) // 60))
+    return f'{total_minutes // 60}h{total_minutes % 60}m'
+
+class SiegeSchedule:
+    '''Siege windows parsed once into minute-of-day values, kept sorted by time of day'''
+    def __init__(self, siege_times: dict, timezone: datetime.tzinfo = SERVER_TIMEZONE) -> None:
+        self.timezone = timezone
+        self.__labels = dict(siege_times) # city -> original string, e.g. 08:30 PM
+        self.__minutes = {city: parse_siege_time(time_str) for city, time_str in siege_times.items()}
+        ordered = sorted((minute, city) for city, minute in self.__minutes.items())
+        self.__ordered_minutes = [minute for minute, _ in ordered]
+        self.__ordered_cities = [city for _, city in ordered]
+        self.__datetimes = {} # date -> {city: aware datetime}, only the most recent dates are kept
+
+    def __contains__(self, city: str) -> bool:
+        return city in self.__minutes
+
+    def siege_times(self) -> dict:
+        '''Returns {city: siege time as published} for every city with a siege window'''
+        return dict(self.__labels)
+
+    def label(self, city: str) -> str:
+        '''Returns the siege time of [city] as published, e.g. 08:30 PM'''
+        return self.__labels[city]
+
+    def minute_of_day(self, city: str) -> int:
+        '''Returns the siege time of [city] as minutes after midnight'''
+        return self.__minutes[city]
+
+    def cities_by_time(self) -> list:
+        '''Returns every city ordered by the time of its siege window'''
+        return list(self.__ordered_cities)
+
+    def now(self, now: datetime.datetime = None) -> datetime.datetime:
+        '''Returns [now] (default: the current time) in the schedule's timezone'''
+        return now.astimezone(self.timezone) if now is not None else datetime.datetime.now(self.timezone)
+
+    def siege_datetime(self, city: str, date: datetime.date) -> datetime.datetime:
+        '''Returns the aware datetime of [city]'s siege window on [date]'''
+        if date not in self.__datetimes:
+            if len(self.__datetimes) >= 3:
+                self.__datetimes.pop(min(self.__datetimes))
+            midnight = datetime.datetime.combine(date, datetime.time())
+            self.__datetimes[date] = {
+                city_name: (midnight + datetime.timedelta(minutes=minute)).replace(tzinfo=self.timezone)
+                for city_name, minute in self.__minutes.items()
+            }
+        return self.__datetimes[date][city]
+
+    def is_in_future(self, city: str, now: datetime.datetime = None) -> bool:
+        '''Returns True if [city]'s siege window has not started yet today'''
+        now = self.now(now)
+        return self.__minutes[city] > now.hour * 60 + now.minute
+
+    def time_until(self, city: str, now: datetime.datetime = None) -> datetime.timedelta:
+        '''Returns the time from [now] until [city]'s siege window today (negative once it has passed)'''
+        now = self.now(now)
+        # subtract in UTC so the result is elapsed time even across a DST change
+        return self.siege_datetime(city, now.date()).astimezone(datetime.timezone.utc) - now.astimezone(datetime.timezone.utc)
+
+    def next_siege(self, now: datetime.datetime = None) -> tuple:
+        '''Returns (city, aware datetime) of the next siege window to start, wrapping to tomorrow'''
+        now = self.now(now)
+        index = bisect.bisect_right(self.__ordered_minutes, now.hour * 60 + now.minute)
+        date = now.date()
+        if index == len(self.__ordered_cities):
+            index, date = 0, date + datetime.timedelta(days=1)
+        city = self.__ordered_cities[index]
+        return city, self.siege_datetime(city, date)
+
+    def next_change(self, now: datetime.datetime = None) -> datetime.datetime:
+        '''Returns when the set of future siege windows next changes: the next window today, or midnight'''
+        now = self.now(now)
+        midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time()).replace(tzinfo=self.timezone)
+        if not self.__ordered_cities:
+            return midnight
+        _, siege_time = self.next_siege(now)
+        return min(siege_time, midnight)
@@ -0,0 +1,43 @@
+# single_flight.py
+'''Coalesces concurrent calls with the same key into one in-flight call that shares its result'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import asyncio
+
+from utils.metrics import REGISTRY
+
+class SingleFlight:
+    '''Runs at most one call per key at a time, callers arriving while it runs await the same result or exception
+
+    The call runs in its own task, so a caller being cancelled does not cancel it for the others.'''
+    def __init__(self) -> None:
+        self.__calls = {} # key -> task of the running call
+        self.__outcomes = REGISTRY.counter('single_flight_calls_total', 'Coalesced calls by key and whether they started or joined a call')
+
+    def in_flight(self, key) -> bool:
+        '''Returns True if a call for [key] is running'''
+        return key in self.__calls
+
+    async def run(self, key, coroutine_function, *args, covered_by=None):
+        '''Returns await coroutine_function(*args), or the result of the call already running for [key]
+
+        If a call for [covered_by] is running it is joined instead, e.g. a refresh of everything covers one city.'''
+        if covered_by is not None and covered_by in self.__calls:
+            key = covered_by
+        task = self.__calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_function(*args))
+            self.__calls[key] = task
+            task.add_done_callback(lambda done_task: self.__forget(key, done_task))
+            self.__outcomes.inc(key=str(key), outcome='started')
+        else:
+            self.__outcomes.inc(key=str(key), outcome='joined')
+        return await asyncio.shield(task)
+
+    def __forget(self, key, task: asyncio.Future) -> None:
+        if self.__calls.get(key) is task:
+            del self.__calls[key]
+        if not task.cancelled():
+            task.exception() # raised to every caller that awaited it, not logged again as never retrieved
@@ -0,0 +1,48 @@
+# snapshot.py
+'''On-disk copy of the bot's cached data so a restart can answer before the first refresh'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import datetime
+import json
+import os
+import tempfile
+
+SNAPSHOT_VERSION = 2
+
+def dump_snapshot(data: dict) -> bytes:
+    '''Returns [data] as compact JSON with the snapshot version and save time added'''
+    return json.dumps(
+        {'version': SNAPSHOT_VERSION, 'saved_at': datetime.datetime.now(datetime.timezone.utc).isoformat(), 'data': data},
+        separators=(',', ':')
+    ).encode('utf-8')
+
+def write_snapshot(path: str, payload: bytes) -> None:
+    '''Writes [payload] to [path] atomically, a crash mid-write leaves the previous snapshot in place'''
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def load_snapshot(path: str) -> tuple:
+    '''Returns (data, saved_at) from the snapshot at [path], or (None, None) if it is missing, unreadable or from another version'''
+    try:
+        with open(path, 'rb') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        return None, None
+    try:
+        saved_at = datetime.datetime.fromisoformat(snapshot['saved_at'])
+    except (KeyError, TypeError, ValueError):
+        return None, None
+    return snapshot.get('data'), saved_at
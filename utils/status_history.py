@@ -0,0 +1,101 @@
+# status_history.py
+'''Bounded per-world history of status transitions, so status questions never need a scrape'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+import collections
+import time
+
+UNAVAILABLE_STATUSES = ('Down', 'Maintenance') # every other status (Good, Busy, Full) lets players log in
+GAP_SECONDS = 900 # observations further apart than this leave the time between them unknown
+
+class WorldStatusHistory:
+    '''Ring buffer of (timestamp, status) transitions per world
+
+    A status of None marks the start of a period with no observations, e.g. while the bot was offline, which
+    is left out of uptime.'''
+    def __init__(self, max_transitions: int = 64) -> None:
+        self.__max_transitions = max_transitions
+        self.__transitions = {} # world -> deque of (timestamp, status)
+        self.__last_seen = {} # world -> timestamp of the latest observation
+
+    def __contains__(self, world_name: str) -> bool:
+        return world_name in self.__transitions
+
+    def worlds(self) -> list:
+        '''Returns every world with recorded history'''
+        return list(self.__transitions)
+
+    def record(self, world_name: str, status: str, timestamp: float = None) -> bool:
+        '''Records that [world_name] was [status] at [timestamp] (default now), returns True if the history changed'''
+        timestamp = time.time() if timestamp is None else timestamp
+        transitions = self.__transitions.get(world_name)
+        if transitions is None:
+            transitions = self.__transitions[world_name] = collections.deque(maxlen=self.__max_transitions)
+        last_seen = self.__last_seen.get(world_name)
+        self.__last_seen[world_name] = timestamp
+        changed = False
+        if last_seen is not None and timestamp - last_seen > GAP_SECONDS:
+            transitions.append((last_seen, None))
+            changed = True
+        if changed or not transitions or transitions[-1][1] != status:
+            transitions.append((timestamp, status))
+            changed = True
+        return changed
+
+    def current(self, world_name: str) -> tuple:
+        '''Returns (status, changed_at, last_seen) for [world_name], or None without history
+
+        changed_at is when the current status was first seen after a different status or an observation gap.'''
+        transitions = self.__transitions.get(world_name)
+        if not transitions or transitions[-1][1] is None:
+            return None
+        status = transitions[-1][1]
+        changed_at = transitions[-1][0]
+        for timestamp, previous_status in reversed(transitions):
+            if previous_status != status:
+                break
+            changed_at = timestamp
+        return status, changed_at, self.__last_seen[world_name]
+
+    def uptime(self, world_name: str, window_seconds: float, now: float = None) -> tuple:
+        '''Returns (fraction available, seconds observed) over the last [window_seconds], or None if nothing was observed'''
+        transitions = self.__transitions.get(world_name)
+        if not transitions:
+            return None
+        now = time.time() if now is None else now
+        window_start = now - window_seconds
+        # each status holds until the next transition, the latest until the last observation
+        ends = [timestamp for timestamp, _ in list(transitions)[1:]] + [self.__last_seen[world_name]]
+        observed = available = 0.0
+        for (start, status), end in zip(transitions, ends):
+            if status is None:
+                continue
+            overlap = min(end, now) - max(start, window_start)
+            if overlap <= 0:
+                continue
+            observed += overlap
+            if status not in UNAVAILABLE_STATUSES:
+                available += overlap
+        if observed == 0:
+            return None
+        return available / observed, observed
+
+    def to_dict(self) -> dict:
+        '''Returns the history as JSON-serializable values'''
+        return {
+            world_name: {'last_seen': self.__last_seen[world_name], 'transitions': [list(transition) for transition in transitions]}
+            for world_name, transitions in self.__transitions.items()
+        }
+
+    def load_dict(self, history: dict) -> None:
+        '''Replaces the history with one returned by to_dict()'''
+        self.__transitions = {}
+        self.__last_seen = {}
+        for world_name, world_history in history.items():
+            self.__transitions[world_name] = collections.deque(
+                ((float(timestamp), status) for timestamp, status in world_history['transitions']),
+                maxlen=self.__max_transitions
+            )
+            self.__last_seen[world_name] = float(world_history['last_seen'])
@@ -0,0 +1,41 @@
+# sync_markers.py
+'''Per-city change markers, so one small read tells which cities need reloading
+
+Whatever writes events bumps the marker of the city it touched, e.g. for a war in Everfall:
+    aws dynamodb update-item --table-name <SYNC_MARKER_TABLE_NAME> \\
+        --key '{"source": {"S": "Everfall"}}' --update-expression 'ADD version :one' \\
+        --expression-attribute-values '{":one": {"N": "1"}}'
+Siege window edits bump the SIEGE_WINDOW_SOURCE marker. Any attribute change counts, so a
+last-modified timestamp works as well as a counter.'''
+# Disable:
+#   C0301: line length (unavoidable)
+# pylint: disable=C0301
+
+from utils.dynamodb_loader import DynamoDBLoader
+
+SIEGE_WINDOW_SOURCE = 'siege-windows'
+
+class SyncMarkers:
+    '''Reads the markers for [sources] from [table_name] (partition key source) and remembers the last synced versions'''
+    def __init__(self, loader: DynamoDBLoader, table_name: str, sources) -> None:
+        self.__loader = loader
+        self.__table_name = table_name
+        self.__sources = list(sources)
+        self.__synced = {} # source -> version last loaded, missing until the first sync
+
+    async def read(self) -> dict:
+        '''Returns {source: version} for every source, None where no marker was written, in one BatchGetItem'''
+        response = await self.__loader.batch_get_items({self.__table_name: [{'source': {'S': source}} for source in self.__sources]})
+        versions = dict.fromkeys(self.__sources)
+        for item in response[self.__table_name]:
+            versions[item['source']['S']] = tuple(sorted((name, str(value)) for name, value in item.items() if name != 'source'))
+        return versions
+
+    async def changed(self) -> dict:
+        '''Returns {source: version} for the sources whose marker differs from the last mark_synced()'''
+        versions = await self.read()
+        return {source: version for source, version in versions.items() if source not in self.__synced or self.__synced[source] != version}
+
+    def mark_synced(self, versions: dict) -> None:
+        '''Records [versions] from read() or changed() as loaded, read them before loading so later writes are not missed'''
+        self.__synced.update(versions)
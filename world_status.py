@@ -4,8 +4,14 @@
 #   C0301: line length (unavoidable)
 # pylint: disable=C0301
 
+import asyncio
+from html.parser import HTMLParser
+from typing import NamedTuple
+
+import aiohttp
 from bs4 import BeautifulSoup
-import requests
+
+from utils.metrics import REGISTRY
 
 region_data_index_match = {
             'us-west': 0,
@@ -15,34 +21,206 @@ region_data_index_match = {
             'ap-southwest': 4
         }
 
-class NWWorldStatusClient:
-    '''Client to retrieve world statuses from the NW website'''
-    def __init__(self, region, world) -> None:
-        self.__nw_url = 'https://www.newworld.com'
-        self.__nw_server_status_page_url = f'{self.__nw_url}/en-us/support/server-status'
-        self.__region_id = region_data_index_match[region]
-        self.world_name = world
-        self.status_list = {}
-        self.refresh_region_server_status()
-        self.world_status = self.status_list[self.world_name]
-
-    def has_world_status_changed(self) -> bool:
-        '''Returns a bool that is true if the server status has changed'''
-        has_changed = False
-        self.refresh_region_server_status()
-        if self.world_status != self.status_list[self.world_name]:
-            has_changed = True
-        self.world_status = self.status_list[self.world_name]
-        return has_changed
-
-    def refresh_region_server_status(self) -> None:
-        '''Refreshes the server statuses for a given region'''
-        attr_prefix = 'ags-ServerStatus-content-responses-response'
-        status_page = requests.get(self.__nw_server_status_page_url)
-        soup = BeautifulSoup(status_page.content, 'html.parser')
-        region_results = soup.find('div', attrs={'data-index': self.__region_id})
-        for world in region_results.find_all('div', attrs={'class': f'{attr_prefix}-server'}):
-            world_soup = BeautifulSoup(world.prettify(), 'html.parser')
-            world_name = world_soup.find('div', attrs={'class': f'{attr_prefix}-server-name'}).text.strip()
-            world_status = world_soup.find('div', attrs={'class': f'{attr_prefix}-server-status'})['title']
-            self.status_list[world_name] = world_status
+ATTR_PREFIX = 'ags-ServerStatus-content-responses-response'
+
+class StatusPageFormatError(Exception):
+    '''Raised when the status page markup does not match what the fast parser expects'''
+
+class _RegionComplete(Exception):
+    '''Stops parsing once the requested region has been read'''
+
+class _ServerStatusParser(HTMLParser):
+    '''Single-pass parser that collects {region_id: {world_name: status}} for [region_id], or every region if None'''
+    def __init__(self, region_id: int = None) -> None:
+        super().__init__(convert_charrefs=True)
+        self.__wanted_region_id = None if region_id is None else str(region_id)
+        self.__region_id = None # data-index of the region container while inside it
+        self.__depth = 0 # current div depth
+        self.__region_depth = None # div depth of the region container while inside it
+        self.__server = None # {'depth': div depth, 'name_parts': [...], 'status': title} of the server entry being read
+        self.__name_depth = None # div depth of the current server name while inside it
+        self.region_status_lists = {}
+
+    def handle_starttag(self, tag, attrs) -> None:
+        if tag != 'div':
+            return
+        self.__depth += 1
+        attr_dict = dict(attrs)
+        if self.__region_depth is None:
+            region_id = attr_dict.get('data-index')
+            if region_id is not None and region_id.isdigit() and self.__wanted_region_id in (None, region_id):
+                self.__region_id = region_id
+                self.__region_depth = self.__depth
+                self.region_status_lists.setdefault(int(region_id), {})
+            return
+        classes = (attr_dict.get('class') or '').split()
+        if f'{ATTR_PREFIX}-server' in classes:
+            self.__server = {'depth': self.__depth, 'name_parts': [], 'status': None}
+        elif self.__server is not None:
+            if f'{ATTR_PREFIX}-server-name' in classes:
+                self.__name_depth = self.__depth
+            elif f'{ATTR_PREFIX}-server-status' in classes:
+                self.__server['status'] = attr_dict.get('title')
+
+    def handle_endtag(self, tag) -> None:
+        if tag != 'div':
+            return
+        if self.__depth == self.__name_depth:
+            self.__name_depth = None
+        elif self.__server is not None and self.__depth == self.__server['depth']:
+            world_name = ''.join(self.__server['name_parts']).strip()
+            if not world_name or self.__server['status'] is None:
+                raise StatusPageFormatError(f'Server entry without a name or status in region {self.__region_id}')
+            self.region_status_lists[int(self.__region_id)][world_name] = self.__server['status']
+            self.__server = None
+        elif self.__depth == self.__region_depth:
+            if self.__wanted_region_id is not None:
+                raise _RegionComplete()
+            self.__region_depth = None
+        self.__depth -= 1
+
+    def handle_data(self, data) -> None:
+        if self.__name_depth is not None:
+            self.__server['name_parts'].append(data)
+
+def fast_parse_server_status(page_content: bytes, region_id: int = None) -> dict:
+    '''Returns {region_id: {world_name: status}} for [region_id] or every region in one pass over the page
+
+    Raises StatusPageFormatError on unexpected markup or a region without servers.'''
+    parser = _ServerStatusParser(region_id)
+    try:
+        parser.feed(page_content.decode('utf-8', errors='replace'))
+        parser.close()
+    except _RegionComplete:
+        pass
+    if not parser.region_status_lists:
+        raise StatusPageFormatError('No regions found' if region_id is None else f'No servers found for region {region_id}')
+    for found_region_id, status_list in parser.region_status_lists.items():
+        if not status_list:
+            raise StatusPageFormatError(f'No servers found for region {found_region_id}')
+    return parser.region_status_lists
+
+def fast_parse_region_server_status(page_content: bytes, region_id: int) -> dict:
+    '''Returns {world_name: status} for [region_id] in one pass over the page, raises StatusPageFormatError on unexpected markup'''
+    return fast_parse_server_status(page_content, region_id)[region_id]
+
+def soup_parse_region_server_status(page_content: bytes, region_id: int) -> dict:
+    '''Returns {world_name: status} for every world listed under [region_id] on the status page using BeautifulSoup, raises StatusPageFormatError'''
+    status_list = {}
+    soup = BeautifulSoup(page_content, 'html.parser')
+    region_results = soup.find('div', attrs={'data-index': region_id})
+    if region_results is None:
+        raise StatusPageFormatError(f'No region {region_id} on the status page')
+    for world in region_results.find_all('div', attrs={'class': f'{ATTR_PREFIX}-server'}):
+        world_soup = BeautifulSoup(world.prettify(), 'html.parser')
+        try:
+            world_name = world_soup.find('div', attrs={'class': f'{ATTR_PREFIX}-server-name'}).text.strip()
+            world_status = world_soup.find('div', attrs={'class': f'{ATTR_PREFIX}-server-status'})['title']
+        except (AttributeError, KeyError, TypeError) as e: # find() returned None or the status has no title
+            raise StatusPageFormatError(f'Server entry without a name or status in region {region_id}') from e
+        status_list[world_name] = world_status
+    return status_list
+
+def soup_parse_server_status(page_content: bytes) -> dict:
+    '''Returns {region_id: {world_name: status}} for every region on the status page using BeautifulSoup'''
+    soup = BeautifulSoup(page_content, 'html.parser')
+    region_ids = [int(region['data-index']) for region in soup.find_all('div', attrs={'data-index': True}) if region['data-index'].isdigit()]
+    if not region_ids:
+        raise StatusPageFormatError('No regions found')
+    return {region_id: soup_parse_region_server_status(page_content, region_id) for region_id in region_ids}
+
+def parse_region_server_status(page_content: bytes, region_id: int) -> dict:
+    '''Returns {world_name: status} for [region_id], falling back to BeautifulSoup if the fast parser rejects the markup'''
+    try:
+        return fast_parse_region_server_status(page_content, region_id)
+    except StatusPageFormatError:
+        return soup_parse_region_server_status(page_content, region_id)
+
+def parse_server_status(page_content: bytes) -> dict:
+    '''Returns {region_id: {world_name: status}} for every region, falling back to BeautifulSoup if the fast parser rejects the markup'''
+    try:
+        return fast_parse_server_status(page_content)
+    except StatusPageFormatError:
+        return soup_parse_server_status(page_content)
+
+def build_world_index(region_status_lists: dict) -> dict:
+    '''Returns {world_name: (region, status)} from parse_server_status(), regions missing from region_data_index_match are named by index'''
+    region_names = {region_id: region for region, region_id in region_data_index_match.items()}
+    world_index = {}
+    for region_id, status_list in sorted(region_status_lists.items()):
+        region = region_names.get(region_id, f'region-{region_id}')
+        for world_name, world_status in status_list.items():
+            world_index.setdefault(world_name, (region, world_status)) # world names are unique across regions
+    return world_index
+
+class StatusPageSettings(NamedTuple):
+    '''Where the poller fetches the status page from and how long it waits for it'''
+    url: str
+    timeout: aiohttp.ClientTimeout
+
+class NWWorldStatusPoller:
+    '''Polls the NW status page once per tick and tracks the status of every watched world, whatever its region'''
+    def __init__(self, worlds, timeout: float = 10, nw_url: str = 'https://www.newworld.com') -> None:
+        self.__status_page = StatusPageSettings(f'{nw_url}/en-us/support/server-status', aiohttp.ClientTimeout(total=timeout))
+        self.__session = None
+        self.watched_worlds = set(worlds)
+        self.world_index = {} # {world_name: (region, status)} for every world on the page, from the latest fetch
+        self.status_list = {} # {world_name: status} for every world on the page, from the latest fetch
+        self.world_status = {} # last known status of each watched world
+        self.changed_worlds = {} # {world_name: (old_status, new_status)} from the latest fetch
+
+    async def __get_session(self) -> aiohttp.ClientSession:
+        '''Returns the poller's pooled session, creating it on first use'''
+        if self.__session is None or self.__session.closed:
+            self.__session = aiohttp.ClientSession(
+                timeout=self.__status_page.timeout,
+                connector=aiohttp.TCPConnector(limit=2)
+            )
+        return self.__session
+
+    async def refresh(self) -> dict:
+        '''Fetches and parses the status page once, then returns the watched worlds whose status changed
+
+        The first refresh only records each world's status, so nothing is reported as changed.'''
+        with REGISTRY.timed('world_status_scrape', 'Status page fetch and parse latency'):
+            session = await self.__get_session()
+            async with session.get(self.__status_page.url) as response:
+                response.raise_for_status()
+                page_content = await response.read()
+            loop = asyncio.get_event_loop()
+            region_status_lists = await loop.run_in_executor(
+                None,
+                parse_server_status,
+                page_content
+            )
+        self.world_index = build_world_index(region_status_lists)
+        self.status_list = {world_name: world_status for world_name, (_, world_status) in self.world_index.items()}
+        self.changed_worlds = {}
+        for world_name in self.watched_worlds:
+            if world_name not in self.status_list:
+                continue # keep the last known status if the world is missing from the page
+            new_status = self.status_list[world_name]
+            old_status = self.world_status.get(world_name)
+            if old_status is not None and old_status != new_status:
+                self.changed_worlds[world_name] = (old_status, new_status)
+            self.world_status[world_name] = new_status
+        return self.changed_worlds
+
+    def region_of(self, world_name: str) -> str:
+        '''Returns the region [world_name] was listed under in the latest fetch, or None'''
+        indexed_world = self.world_index.get(world_name)
+        return indexed_world[0] if indexed_world is not None else None
+
+    def set_watched_worlds(self, worlds) -> None:
+        '''Replaces the watched worlds, forgetting the last status of worlds no longer watched
+
+        Newly watched worlds start like they do on the first refresh, their first status is not reported as a change.'''
+        self.watched_worlds = set(worlds)
+        for world_name in list(self.world_status):
+            if world_name not in self.watched_worlds:
+                del self.world_status[world_name]
+
+    async def close(self) -> None:
+        '''Closes the pooled HTTP session'''
+        if self.__session is not None:
+            await self.__session.close()